@@ -1,20 +1,32 @@
-import base64
-import json
+import startupReport
+startupReport.enable_if_requested()  # Before the imports below, so they are measured
+import instrumentation
+instrumentation.enable_if_requested()
 import sys
-from PyQt5.QtWidgets import QDesktopWidget, QToolButton, QPushButton, QLineEdit, QApplication, QMainWindow, QFileDialog, QLabel, QVBoxLayout, QWidget, QScrollArea, QMessageBox, QMenuBar, QMenu, QAction, QTabWidget, QHBoxLayout, QPushButton, QDialog
-from PyQt5.QtGui import QPixmap, QImage, QPainter, QIcon, QColor, QFont, QBrush
-from PyQt5.QtCore import Qt, QRect
-from PyQt5.QtPrintSupport import QPrinter, QPrintDialog, QPrintPreviewDialog
-import fitz  # PyMuPDF for PDFs
-from PIL import Image
+from PyQt5.QtWidgets import QSplashScreen, QDesktopWidget, QToolButton, QPushButton, QLineEdit, QApplication, QMainWindow, QFileDialog, QLabel, QVBoxLayout, QWidget, QScrollArea, QMessageBox, QMenuBar, QMenu, QAction, QActionGroup, QTabWidget, QHBoxLayout, QDialog
+from PyQt5.QtGui import QPixmap, QIcon, QFont
+from PyQt5.QtCore import Qt, QTimer
 import os
 import logging
-from PyQt5.QtCore import QPointF
-import BNExtensionAsAModule
+from pageView import LazyPageLoader, PageLabel
+from renderService import RenderService
+from pageCache import PageCache
+from viewerDocument import ViewerDocument
+from documentLoader import DocumentLoader, read_qfs_file
+from watermark import WatermarkedWidget
+from fileBrowser import FileBrowserDock
+from thumbnailSidebar import ThumbnailSidebar
+from singleInstance import InstanceServer, file_arguments, forward_to_running_instance, NEW_INSTANCE_FLAG
+import multiprocessing
 
+# fitz is imported when the first file is opened (viewerDocument), print
+# support when printing (printPipeline) and the converter after the QFS login
+startupReport.mark("imports done")
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Configure logging, timings are collected by instrumentation (--instrument) instead of DEBUG messages
+logging.basicConfig(level=logging.DEBUG if "--debug" in sys.argv else logging.INFO,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
 
 
 class HelpDialog(QDialog):
@@ -104,66 +116,6 @@ class HelpDialog(QDialog):
         super().resizeEvent(event)
 
 
-class WatermarkedWidget(QWidget):
-    def __init__(self, parent=None, watermark_text="QFS COPY"):
-        super().__init__(parent)
-        self.watermark_text = watermark_text
-    
-    def generate_watermark_pixmap(self, width=200, height=200):
-        pixmap = QPixmap(width, height)
-        pixmap.fill(Qt.transparent)
-        
-        painter = QPainter(pixmap)
-        painter.setPen(QColor(200, 200, 200, 90))  # Semi-transparent gray
-        font = QFont("Arial", 30)
-        painter.setFont(font)
-        
-        center_x = int(width / 2)
-        center_y = int(height / 2)
-        
-        painter.translate(center_x, center_y)
-        painter.rotate(-45)
-        painter.drawText(-center_x , 0, self.watermark_text)
-        painter.end()
-        return pixmap
-        
-    
-    def paintEvent(self, event):
-        painter = QPainter(self)
-        watermark_pixmap = self.generate_watermark_pixmap()
-        brush = QBrush(watermark_pixmap)
-        painter.fillRect(self.rect(), brush)
-        
-        super().paintEvent(event)
-        
-        
-class CustomPrintDialog(QPrintDialog):
-    def __init__(self, printer, parent=None):
-        super().__init__(printer, parent)
-        self.setOption(QPrintDialog.PrintPageRange)
-        self.buttonBox = self.findChild(QPushButton, "qt_msgbox_buttonbox")
-        self.buttonBox.button(QPrintDialog.Accepted).setEnabled(False)
-        self.fromPageLineEdit = self.findChild(QLineEdit, "qt_spinbox_lineedit")
-        self.toPageLineEdit = self.findChild(QLineEdit, "qt_spinbox_lineedit")
-        self.fromPageLineEdit.textChanged.connect(self.validate_page_range)
-        self.toPageLineEdit.textChanged.connect(self.validate_page_range)
-
-    def validate_page_range(self):
-        try:
-            from_page = int(self.fromPageLineEdit.text()) - 1
-            to_page = int(self.toPageLineEdit.text()) - 1
-            if 0 <= from_page <= to_page < len(self.parent().pages):
-                self.buttonBox.button(QPrintDialog.Accepted).setEnabled(True)
-            else:
-                self.buttonBox.button(QPrintDialog.Accepted).setEnabled(False)
-        except ValueError:
-            self.buttonBox.button(QPrintDialog.Accepted).setEnabled(False)
-
-    def accept(self):
-        self.validate_page_range()
-        if self.buttonBox.button(QPrintDialog.Accepted).isEnabled():
-            super().accept()
-
 class LoginDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -240,8 +192,23 @@ class CustomFileViewer(QMainWindow):
         window_geometry.moveCenter(screen_geometry.center())
         self.move(window_geometry.topLeft())
 
-        # Initialize pages attribute
-        self.pages = []
+        # Every tab showing a file owns a ViewerDocument
+        self.documents = {}  # tab widget -> ViewerDocument
+
+        # Pages are rasterized by a pool of worker processes
+        self.render_service = RenderService(parent=self)
+
+        # Rendered pages shared by all tabs, keyed by the content hash of the QFS payload
+        self.page_cache = PageCache()
+
+        # QFS files are read in a thread pool, their tabs are filled in as they finish
+        self.document_loader = DocumentLoader(parent=self)
+        self.document_loader.fileLoaded.connect(self.on_file_loaded)
+        self.document_loader.fileFailed.connect(self.on_file_failed)
+        self.loading_tabs = {}  # load request id -> (tab widget, loading message)
+
+        # Documents are opened in memory now, clean up copies left by older versions
+        self.remove_extracted_files()
         
         # Add a drag & drop function
         self.setAcceptDrops(True)
@@ -257,6 +224,11 @@ class CustomFileViewer(QMainWindow):
         self.tab_widget.setTabsClosable(True)
         self.tab_widget.tabCloseRequested.connect(self.close_tab)
         self.setCentralWidget(self.tab_widget)
+
+        # Recent files and folder listing, filled from the file headers only
+        self.file_browser = FileBrowserDock(self)
+        self.file_browser.fileActivated.connect(lambda path: self.open_paths([path]))
+        self.addDockWidget(Qt.LeftDockWidgetArea, self.file_browser)
         
         # Add an introductory instructions on viewer
         self.add_instructions_tab()
@@ -283,12 +255,54 @@ class CustomFileViewer(QMainWindow):
         self.print_action = QAction("Print", self)
         self.print_action.triggered.connect(self.print_document)
         self.file_menu.addAction(self.print_action)
+
+        # Add a "Print Mode" submenu, vector output keeps text sharp and falls back to images per page
+        # The values are printPipeline.PRINT_MODES, that module is only imported when printing
+        self.print_mode = "raster"
+        self.print_mode_menu = self.file_menu.addMenu("Print Mode")
+        self.print_mode_group = QActionGroup(self)
+        for mode, label in (("raster", "Image (Raster)"), ("vector", "Vector")):
+            action = QAction(label, self, checkable=True)
+            action.setChecked(mode == self.print_mode)
+            action.triggered.connect(lambda checked, mode=mode: self.set_print_mode(mode))
+            self.print_mode_group.addAction(action)
+            self.print_mode_menu.addAction(action)
         
         # Add a "Print Preview" action to the "File" menu
         self.print_preview_action = QAction("Print Preview", self)
         self.print_preview_action.triggered.connect(self.print_preview)
         self.file_menu.addAction(self.print_preview_action)
         
+        # Add a "View" menu, large pages are rendered in tiles when zoomed in
+        self.view_menu = QMenu("View", self)
+        self.menu_bar.addMenu(self.view_menu)
+
+        self.zoom_in_action = QAction("Zoom In", self)
+        self.zoom_in_action.setShortcut("Ctrl++")
+        self.zoom_in_action.triggered.connect(lambda: self.zoom_by(1.25))
+        self.view_menu.addAction(self.zoom_in_action)
+
+        self.zoom_out_action = QAction("Zoom Out", self)
+        self.zoom_out_action.setShortcut("Ctrl+-")
+        self.zoom_out_action.triggered.connect(lambda: self.zoom_by(0.8))
+        self.view_menu.addAction(self.zoom_out_action)
+
+        self.zoom_reset_action = QAction("Fit Page", self)
+        self.zoom_reset_action.setShortcut("Ctrl+0")
+        self.zoom_reset_action.triggered.connect(lambda: self.zoom_by(None))
+        self.view_menu.addAction(self.zoom_reset_action)
+
+        self.view_menu.addSeparator()
+        self.view_menu.addAction(self.file_browser.toggleViewAction())
+
+        # Per-stage timings, only collected when the viewer runs with --instrument
+        if instrumentation.is_enabled():
+            from statsPanel import StatsDock
+            self.stats_dock = StatsDock(self)
+            self.addDockWidget(Qt.BottomDockWidgetArea, self.stats_dock)
+            self.stats_dock.hide()
+            self.view_menu.addAction(self.stats_dock.toggleViewAction())
+
         # Add a "About" menu
         self.about_menu = QMenu("About", self)
         self.menu_bar.addMenu(self.about_menu)
@@ -316,21 +330,56 @@ class CustomFileViewer(QMainWindow):
         if event.mimeData().hasUrls():
             event.acceptProposedAction()
     
+    def open_paths(self, file_paths):
+        """
+        Open files given on the command line or forwarded by another launch of the viewer.
+
+        A launch without files forwards an empty list, the window is only brought to the front then.
+        """
+        if file_paths:
+            if self.tab_widget.count() == 1 and self.tab_widget.tabText(0) == "Instructions":
+                self.tab_widget.removeTab(0)
+            for file_path in file_paths:
+                if not os.path.isfile(file_path):
+                    logging.error(f"File not found: {file_path}")
+                    QMessageBox.information(self, "File Not Found", f"The file {file_path} does not exist.")
+            self.open_files([file_path for file_path in file_paths if os.path.isfile(file_path)])
+
+        # Bring the window to the front, the files usually come from Explorer
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
     def dropEvent(self, event):
+        file_paths = []
         for url in event.mimeData().urls():
             file_path = url.toLocalFile()
             if file_path.endswith(".QFS"):
-                self.open_viewer_window(file_path)
+                file_paths.append(file_path)
             else:
                 QMessageBox.information(self, "Invalid File", "File Not Supported")
+        # All dropped files are read in parallel
+        self.open_files(file_paths)
         event.acceptProposedAction()
     
         
     def print_preview(self):
         """Show a print preview dialog."""
+        document = self.current_document()
+        if document is None:
+            QMessageBox.information(self, "Print Preview", "Open a file to preview it.")
+            return
+
+        from PyQt5.QtPrintSupport import QPrinter, QPrintPreviewDialog
+        from printPreview import PrintPreview
+
         self.printer = QPrinter(QPrinter.HighResolution)
         self.preview = QPrintPreviewDialog(self.printer, self)
-        self.preview.paintRequested.connect(self.print_preview_document)
+        # Pages come from the preview cache, built once per document and page setup
+        preview_pages = PrintPreview(self.render_service, self.page_cache, document, self.preview)
+        self.preview.paintRequested.connect(lambda printer: self.override_print_button())
+        self.preview.paintRequested.connect(preview_pages.paint)
         self.preview.exec()
         
         
@@ -340,8 +389,7 @@ class CustomFileViewer(QMainWindow):
         try:
             file_paths, _ = QFileDialog.getOpenFileNames(self, "Select Custom Files", "", "Custom Files (*.QFS);;All Files (*)")
             if file_paths:
-                for file_path in file_paths:
-                    self.open_viewer_window(file_path)
+                self.open_files(file_paths)
                 self.show()  # Show the main window only if files are selected
             
             elif self.isVisible():
@@ -359,6 +407,8 @@ class CustomFileViewer(QMainWindow):
     def qfs_open(self):
         login = LoginDialog(self)
         if login.exec_() == QDialog.Accepted:
+            # The converter pulls in Tk and fitz, only load it for users who logged in
+            import BNExtensionAsAModule
             BNExtensionAsAModule.main()
         
     def add_instructions_tab(self):
@@ -376,6 +426,21 @@ class CustomFileViewer(QMainWindow):
         layout.addWidget(instructions_label)
         self.tab_widget.addTab(instructions_tab, "Instructions")
     
+    def remove_extracted_files(self):
+        """Delete the plaintext copies older versions extracted to %APPDATA%/CFV/extracted files."""
+        appdata_folder = os.getenv("APPDATA")
+        if not appdata_folder:
+            return
+        subfolder_path = os.path.join(appdata_folder, "CFV", "extracted files")
+        if not os.path.isdir(subfolder_path):
+            return
+        for name in os.listdir(subfolder_path):
+            if name.startswith("extracted_"):
+                try:
+                    os.remove(os.path.join(subfolder_path, name))
+                except OSError as e:
+                    logging.warning(f"Could not remove extracted file {name}: {e}")
+
     def show_usage_instructions(self):
         # This function can open another dialog or tab explaining the application usage.
         help_dialog = HelpDialog(self)
@@ -384,39 +449,62 @@ class CustomFileViewer(QMainWindow):
     
     
     def open_viewer_window(self, custom_file_path):
+        """Open a QFS file in a new tab, reading it on the GUI thread. open_files reads several files in parallel."""
         try:
-            # Read and decode the .myext file
-            with open(custom_file_path, "r") as custom_file:
-                data = json.load(custom_file)
-
-            # Extract metadata and content
-            original_type = data["metadata"]["original_type"]
-            file_name = data["metadata"]["file_name"]
-            decoded_content = base64.b64decode(data["content"])
-
-            # Create a folder named "extracted_files" if it doesn't exist
-            # STORE IN %APPDATA%
-            appdata_folder = os.getenv("APPDATA")
-            
-            extracted_folder = os.path.join(appdata_folder, "CFV")
-            
-            subfolder_name = "extracted files"
-            subfolder_path = os.path.join(extracted_folder, subfolder_name)
-            
-            os.makedirs(subfolder_path, exist_ok=True)
-
-            # Save the extracted file locally in the "extracted_files" folder
-            output_file = os.path.join(subfolder_path, f"extracted_{file_name}")
-            with open(output_file, "wb") as original_file:
-                original_file.write(decoded_content)
-
-            # Create a new tab for the file
+            loaded = read_qfs_file(custom_file_path)
+        except Exception as e:
+            logging.error(f"Failed to open viewer window for {custom_file_path}: {e}")
+            QMessageBox.critical(self, "Error", f"An error occurred: {e}")
+            return
+        tab = QWidget()
+        QHBoxLayout(tab)
+        self.tab_widget.addTab(tab, loaded.file_name.replace(".pdf", ""))
+        self.show_loaded_file(tab, loaded)
+
+    def open_files(self, file_paths):
+        """
+        Open QFS files in new tabs, reading them in parallel with the document loader.
+
+        Every tab is added right away with a loading message and filled in
+        once its file has been read, in whatever order the files finish.
+        """
+        for file_path in file_paths:
             tab = QWidget()
-            layout = QVBoxLayout(tab)
-            layout.setAlignment(Qt.AlignmentFlag.AlignVCenter)
+            layout = QHBoxLayout(tab)
+            placeholder = QLabel(f"Loading {os.path.basename(file_path)}...", tab)
+            placeholder.setAlignment(Qt.AlignCenter)
+            layout.addWidget(placeholder)
+            self.tab_widget.addTab(tab, os.path.splitext(os.path.basename(file_path))[0])
+            request_id = self.document_loader.load(file_path)
+            self.loading_tabs[request_id] = (tab, placeholder)
+
+    def on_file_loaded(self, request_id, loaded):
+        entry = self.loading_tabs.pop(request_id, None)
+        if entry is None:
+            return  # The tab was closed while the file was read
+        tab, placeholder = entry
+        tab.layout().removeWidget(placeholder)
+        placeholder.deleteLater()
+        self.tab_widget.setTabText(self.tab_widget.indexOf(tab), loaded.file_name.replace(".pdf", ""))
+        self.show_loaded_file(tab, loaded)
+
+    def on_file_failed(self, request_id, file_path, message):
+        entry = self.loading_tabs.pop(request_id, None)
+        if entry is None:
+            return
+        tab, _ = entry
+        self.tab_widget.removeTab(self.tab_widget.indexOf(tab))
+        tab.deleteLater()
+        logging.error(f"Failed to open viewer window for {file_path}: {message}")
+        QMessageBox.critical(self, "Error", f"An error occurred: {message}")
+
+    def show_loaded_file(self, tab, loaded):
+        """Fill a tab with the pages and the thumbnail sidebar of a file read by read_qfs_file."""
+        custom_file_path = loaded.path
+        try:
+            layout = tab.layout()
             scroll_area = QScrollArea(tab)
             scroll_area.setWidgetResizable(True)
-            container = QWidget()
             
             container = WatermarkedWidget(watermark_text="QFS COPY")
             container_layout = QVBoxLayout(container)
@@ -425,17 +513,25 @@ class CustomFileViewer(QMainWindow):
             
             
             layout.addWidget(scroll_area)
-            self.tab_widget.addTab(tab, file_name.replace(".pdf", ""))
 
             # Display content based on file type
-            if original_type == "pdf":
-                self.display_pdf(output_file, container_layout)
+            if loaded.original_type == "pdf":
+                document = ViewerDocument(custom_file_path, loaded.metadata, loaded.payload, self.render_service, self.page_cache,
+                                          loaded.page_index, loaded.thumbnails, loaded.payload_sha256)
+                self.documents[tab] = document
+                self.display_pdf(document, container_layout, scroll_area)
+                if document.loader is not None:
+                    document.sidebar = ThumbnailSidebar(self.render_service, self.page_cache, document, parent=tab)
+                    document.sidebar.pageSelected.connect(document.loader.scroll_to_page)
+                    document.loader.currentPageChanged.connect(document.sidebar.set_current_page)
+                    layout.insertWidget(0, document.sidebar)
+                self.file_browser.add_recent(custom_file_path)
             
             elif self.isVisible():
                 QMessageBox.information(self, "Unsupported File", "File type is not supported for viewing.")
                 
             else:
-                logging.error(f"Unsupported file type: {original_type}")
+                logging.error(f"Unsupported file type: {loaded.original_type}")
                 QMessageBox.information(self, "Unsupported File", "File type is not supported for viewing.")
                 
         except Exception as e:
@@ -443,38 +539,21 @@ class CustomFileViewer(QMainWindow):
             QMessageBox.critical(self, "Error", f"An error occurred: {e}")
 
         
-    def display_pdf(self, pdf_path, layout):
-        """Render a PDF document."""
+    def display_pdf(self, document, layout, scroll_area):
+        """Lay out a PDF document held in memory, pages are rendered once they scroll near the view."""
         try:
-            self.pages = []  # Clear any previous pages
-            page_dimensions = []  # Store original dimensions
-            pdf_document = fitz.open(pdf_path)
-            self.pdf_path = pdf_path
-
-            for page_num in range(len(pdf_document)):
-                page = pdf_document[page_num]
-                pix = page.get_pixmap()  # Render at 300 DPI
-                image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                self.pages.append(image)
-
-                # Get original dimensions in points (1 point = 1/72 inch)
-                width_points = page.mediabox.width
-                height_points = page.mediabox.height
-
-                # Convert points to centimeters (1 point = 0.0352778 cm)
-                width_cm = width_points * 0.0352778
-                height_cm = height_points * 0.0352778
-
-                page_dimensions.append((width_cm, height_cm))
-
-            self.render_all_pages(self.pages, page_dimensions, layout)
+            with instrumentation.span("layout"):
+                page_labels = self.render_all_pages(document.page_sizes, document.page_dimensions, layout)
+            instrumentation.count("layout", "pages", len(page_labels))
+            document.loader = LazyPageLoader(self.render_service, document.doc_key, self.page_cache, document.doc_hash,
+                                             document.page_sizes, scroll_area, page_labels)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to render PDF: {e}")
             
     
     
-    def render_all_pages(self, pages, page_dimensions, layout):
-        """Render all pages on the canvas.""" 
+    def render_all_pages(self, page_sizes, page_dimensions, layout):
+        """Lay out a placeholder for every page on the canvas and return the page labels."""
         max_width_portrait = 800
         max_height_portrait = 1000
         max_width_landscape = 1000
@@ -482,32 +561,28 @@ class CustomFileViewer(QMainWindow):
 
         tolerance = 0.1  # Tolerance for dimension comparison
 
-        for page_num, (page_image, (width_cm, height_cm)) in enumerate(zip(pages, page_dimensions)):
+        page_labels = []
+
+        for page_num, ((page_width, page_height), (width_cm, height_cm)) in enumerate(zip(page_sizes, page_dimensions)):
             # Determine the maximum dimensions based on orientation
-            if page_image.width > page_image.height:
+            if page_width > page_height:
                 max_width = max_width_landscape
                 max_height = max_height_landscape
             else:
                 max_width = max_width_portrait
                 max_height = max_height_portrait
 
-            # Calculate the scaling factor to fit the image within the maximum dimensions
-            scale_factor = min(max_width / page_image.width, max_height / page_image.height, 1)
-            new_width = int(page_image.width * scale_factor)
-            new_height = int(page_image.height * scale_factor)
-
-            # Resize the image
-            resized_image = page_image.resize((new_width, new_height), Image.LANCZOS)
+            # Calculate the scaling factor to fit the page within the maximum dimensions
+            scale_factor = min(max_width / page_width, max_height / page_height, 1)
+            new_width = int(page_width * scale_factor)
+            new_height = int(page_height * scale_factor)
 
-            # Convert PIL image to QImage
-            image_qt = QImage(resized_image.tobytes(), resized_image.width, resized_image.height, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(image_qt)
-            
-            # Create a QLabel to display the image
-            label = QLabel(self)
-            label.setPixmap(pixmap)
+            # Create a placeholder QLabel of the final size, the page is drawn into it when it scrolls into view
+            label = PageLabel(self)
+            label.setFixedSize(new_width, new_height)
             label.setAlignment(Qt.AlignCenter)
-            layout.addWidget(label)
+            layout.addWidget(label, 0, Qt.AlignHCenter)
+            page_labels.append(label)
 
             # Display the page number
             page_label = QLabel(f"Page {page_num + 1}", self)
@@ -620,66 +695,21 @@ class CustomFileViewer(QMainWindow):
                 size_label.setAlignment(Qt.AlignCenter)
                 layout.addWidget(size_label)
 
-    def print_preview_document(self, printer):
-        """Render the document for print preview."""
-        self.override_print_button()
-        painter = QPainter(printer)
-        
-        painter.setRenderHint(QPainter.Antialiasing)
-        painter.setRenderHint(QPainter.SmoothPixmapTransform)
-        
-        for i, page_image in enumerate(self.pages):
-            if i > 0:
-                printer.newPage()
-            image_qt = QImage(page_image.tobytes(), page_image.width, page_image.height, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(image_qt)
-            rect = painter.viewport()
-            size = pixmap.size()
-            size.scale(rect.size(), Qt.KeepAspectRatio)
-            painter.setViewport(rect.x(), rect.y(), size.width(), size.height())
-            painter.setWindow(pixmap.rect())
-            painter.drawPixmap(0, 0, pixmap)
-
-        painter.end()
-    
-    def render_pages_for_print(self, start_page, end_page):
-        "Re-render PDF pages at various DPI settings for printing"
-        pages_print = []
-        pdf_document = fitz.open(self.pdf_path)
-        dpi_options = [600, 300, None]  # None for default DPI
-        
-        # Ensure we stay within bounds
-        end_page = min(end_page, len(pdf_document) - 1)
-        start_page = max(start_page, 0)
-
-        for page_number in range(start_page, end_page + 1):
-            page = pdf_document[page_number]
-            pix = None
-            for dpi in dpi_options:
-                try:
-                    if dpi is None:
-                        pix = page.get_pixmap()  # default DPI
-                    else:
-                        pix = page.get_pixmap(dpi=dpi)
-                    # If rendering succeeds, break out of the loop
-                    logging.info(f"Rendered page {page_number+1} at {'default' if dpi is None else dpi} DPI.")
-                    break
-                except Exception as e:
-                    logging.warning(f"Failed to render page {page_number+1} at {'default' if dpi is None else dpi} DPI: {e}")
-            if pix is None:
-                logging.error(f"All rendering attempts failed for page {page_number+1}. Skipping this page.")
-                continue
-
-            image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            pages_print.append(image)
-        
-        pdf_document.close()
-        return pages_print
+        return page_labels
 
     
     def print_document(self):
+        # Print the document of the active tab
+        document = self.current_document()
+        if document is None:
+            QMessageBox.information(self, "Print", "Open a file to print it.")
+            return
+
+        from PyQt5.QtPrintSupport import QPrinter, QPrintDialog
+        from printPipeline import PrintJob
+
+        # The print job renders at the resolution of the selected printer, see printPipeline
         printer = QPrinter(QPrinter.HighResolution)
-        printer.setResolution(600)  # Set high DPI for better quality
         # set page margins
         printer.setPageMargins(0, 0, 30, 0, QPrinter.Millimeter)
         print_dialog = QPrintDialog(printer, self)
@@ -694,59 +724,34 @@ class CustomFileViewer(QMainWindow):
             if from_page == -1 and to_page == -1:
                 from_page = 0
                 # Know how many page are there
-                total_pages = self.get_pdf_page_count(self.pdf_path)
+                total_pages = document.page_count
                 to_page = total_pages - 1
                 
-            # Re-render pages at high DPI for printing in selected range
-            pages_to_print = self.render_pages_for_print(from_page, to_page)
-            
-            self.print_selected_pages(printer, pages_to_print, 0, (to_page - from_page))
-            
-            
-    def print_selected_pages(self, printer, pages, from_page, to_page):
-        """Print the selected pages."""
-        painter = QPainter(printer)
-        painter.setRenderHint(QPainter.Antialiasing)
-        painter.setRenderHint(QPainter.SmoothPixmapTransform)
-        
-        for i in range(from_page, to_page + 1):
-            if i > from_page:
-                printer.newPage()
-            page_image = pages[i]
-            # Ensure image is in RGB Mode
-            if page_image.mode != "RGB":
-                page_image = page_image.convert("RGB")
-            bytes_per_line = page_image.width * 3    
-            image_qt = QImage(page_image.tobytes(), page_image.width, page_image.height, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(image_qt)
-            
-            # Calculate target rect based on printer page react
-            page_rect = printer.pageRect()
-            scaled_size = pixmap.size()
-            scaled_size.scale(page_rect.size(), Qt.KeepAspectRatio)
-            pixmap_size = pixmap.size()
-            
-            x = (page_rect.x() + (page_rect.width() - pixmap_size.width()) - 200) // 2
-            y = (page_rect.y() + (page_rect.height() - pixmap_size.height())) // 2
-            
-            if x >= 0 and x <= 1000 or y >= 0 and y <= 1000:
-                target_rect = QRect(-150, -75, pixmap_size.width(), pixmap_size.height())
-            elif x <= -0 and x >= -1000:
-                target_rect = QRect(-150, -75, pixmap_size.width(), pixmap_size.height())
-            else:
-                target_rect = QRect(x, y, pixmap_size.width(), pixmap_size.height())
-
-            logging.debug(f"Drawing page {i+1}: target rect {target_rect}")
-            
-            painter.drawPixmap(target_rect, pixmap)
-        
-        painter.end()
-    
-    def get_pdf_page_count(self, pdf_path):
-        doc = fitz.open(pdf_path)
-        count = len(doc)
-        doc.close()
-        return count
+            # Ensure we stay within bounds
+            to_page = min(to_page, document.page_count - 1)
+            from_page = max(from_page, 0)
+
+            # Render, print and release the pages one at a time
+            print_job = PrintJob(self.render_service, document, printer, range(from_page, to_page + 1),
+                                 mode=self.print_mode, parent=self)
+            print_job.run()
+            print_job.deleteLater()
+
+    def zoom_by(self, factor):
+        """Zoom the pages of the active tab, None goes back to the fitted size."""
+        document = self.current_document()
+        if document is None or document.loader is None:
+            return
+        loader = document.loader
+        loader.set_zoom(1.0 if factor is None else loader.zoom * factor)
+
+    def set_print_mode(self, mode):
+        logging.info(f"Print mode set to {mode}.")
+        self.print_mode = mode
+
+    def current_document(self):
+        """Return the ViewerDocument of the active tab, or None."""
+        return self.documents.get(self.tab_widget.currentWidget())
         
     def override_print_button(self):
         """Override the print button action inside QPrintPreviewDialog."""
@@ -756,8 +761,29 @@ class CustomFileViewer(QMainWindow):
     
     def close_tab(self, index):
         """Close the tab8.10 at the given index."""
+        tab = self.tab_widget.widget(index)
         self.tab_widget.removeTab(index)
 
+        # A file still being read is dropped when it arrives
+        for request_id, (loading_tab, _) in list(self.loading_tabs.items()):
+            if loading_tab is tab:
+                del self.loading_tabs[request_id]
+
+        # Release the document of the tab, cached pages are kept while another tab shows the same file
+        document = self.documents.pop(tab, None)
+        if document is not None:
+            shared = any(other.doc_hash == document.doc_hash for other in self.documents.values())
+            document.close(release_cache=not shared)
+
+        # Delete the page labels and their pixmaps along with the tab
+        tab.deleteLater()
+
+    def closeEvent(self, event):
+        """Stop the render worker processes and the file readers when the window closes."""
+        self.document_loader.shutdown()
+        self.render_service.shutdown()
+        super().closeEvent(event)
+
     def center_window(self):
         """Centers the window on the screen."""
         screen_geometry = QDesktopWidget().screenGeometry()
@@ -798,8 +824,42 @@ class CustomFileViewer(QMainWindow):
 
 
 if __name__ == "__main__":
+    # Needed by the render worker processes in the frozen .exe
+    multiprocessing.freeze_support()
     app = QApplication([])
+    startupReport.mark("QApplication created")
+
+    # Hand the files to a viewer that is already running instead of starting another one
+    file_paths = file_arguments(sys.argv)
+    if NEW_INSTANCE_FLAG not in sys.argv and forward_to_running_instance(file_paths):
+        sys.exit(0)
+    instance_server = InstanceServer()
+
+    # Show the splash screen before building the main window
+    splash = QSplashScreen(QPixmap("iconFileViewer512.ico").scaled(256, 256, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+    splash.show()
+    splash.showMessage("Starting Custom File Viewer...", Qt.AlignBottom | Qt.AlignHCenter)
+    app.processEvents()
+    startupReport.mark("splash shown")
+
     app.setWindowIcon(QIcon("iconFileViewer512.ico"))
     viewer = CustomFileViewer()
+    startupReport.mark("main window created")
     viewer.show()  # Open the file dialog before showing the main window
+    splash.finish(viewer)
+    startupReport.mark("main window shown")
+
+    # A viewer started with --new-instance leaves the running one as the target of later launches
+    if NEW_INSTANCE_FLAG not in sys.argv:
+        instance_server.filesReceived.connect(viewer.open_paths)
+        instance_server.listen()
+    viewer.open_paths(file_paths)
+
+    def write_startup_report():
+        startupReport.mark("event loop running")
+        startupReport.write_report()
+
+    # The report is written once the event loop has painted the window
+    if startupReport.is_enabled():
+        QTimer.singleShot(0, write_startup_report)
     app.exec_()
@@ -1,11 +1,29 @@
-import base64
-import json
+import argparse
+import glob
 import os
-from tkinter import Tk, filedialog
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import qfsFormat
+
+
+# Largest edge in pixels of the page thumbnails stored in the QFS file
+THUMBNAIL_SIZE = 160
 
 
 # PDF CONVERSION
-def convert_pdf(file_path, output_path):
+def page_thumbnail(page, size=THUMBNAIL_SIZE):
+    """PNG thumbnail of a fitz.Page whose largest edge is `size` pixels."""
+    import fitz
+
+    zoom = size / max(page.rect.width, page.rect.height)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return pix.tobytes("png")
+
+
+def convert_pdf(file_path, output_path, format_version=qfsFormat.FORMAT_VERSION, codec=qfsFormat.DEFAULT_CODEC, level=None, thumbnails=True,
+                chunk_store=None):
     # Import the required module
     import fitz
 
@@ -17,25 +35,48 @@ def convert_pdf(file_path, output_path):
     height_cm = rect.height * 0.0352778
     orientation = "Landscape" if width_cm > height_cm else "Portrait"
 
+    file_metadata = {
+        "original_type": file_path.split(".")[-1].lower(),
+        "file_name": os.path.basename(file_path),
+        "orientation": orientation,
+        "height": f"{height_cm:.2f}cm",
+        "width": f"{width_cm:.2f}cm",
+        "author": doc.metadata.get("author", ""),
+        "creation_date": doc.metadata.get("creationDate", ""),
+        "page_count": len(doc),
+    }
+    # Lets batch conversions tell whether an output is still up to date, in chunk
+    # store mode it is computed while the payload is stored
+    if chunk_store is None:
+        file_metadata["payload_sha256"] = qfsFormat.file_sha256(file_path)
+
+    # Page index and thumbnails let the viewer lay out the pages before opening the PDF
+    extra_chunks = []
+    if format_version != qfsFormat.LEGACY_VERSION:
+        extra_chunks.append(qfsFormat.pack_page_index(
+            [(page.mediabox.width, page.mediabox.height, page.rotation) for page in doc]))
+        if thumbnails:
+            extra_chunks.append(qfsFormat.pack_thumbnails([page_thumbnail(page) for page in doc], "png", THUMBNAIL_SIZE))
+    doc.close()
+
+    # Stream the PDF into the QFS file block by block (see qfsFormat.py)
     with open(file_path, "rb") as file:
-        content = file.read()
-        encoded_content = base64.b64encode(content).decode("utf-8")
-
-        file_metadata = {
-            "metadata": {
-                "original_type": file_path.split(".")[-1],
-                "file_name": os.path.basename(file_path),
-                "orientation": orientation,
-                "height": f"{height_cm:.2f}cm",
-                "width": f"{width_cm:.2f}cm",
-                "author": doc.metadata.get("author", ""),
-                "creation_date": doc.metadata.get("creationDate", "")
-            },
-            "content": encoded_content
-        }
-
-        with open(output_path, "w") as output_file:
-            json.dump(file_metadata, output_file)
+        if format_version == qfsFormat.LEGACY_VERSION:
+            # Original JSON layout, for viewers older than the binary container
+            if codec != "none":
+                raise ValueError("Compression needs the binary container (format version 2)")
+            if chunk_store is not None:
+                raise ValueError("The chunk store needs the binary container (format version 2)")
+            qfsFormat.write_legacy_qfs(output_path, file_metadata, file)
+        elif chunk_store is not None:
+            # Only the chunks that are not in the store yet, from earlier revisions, are written
+            import chunkStore
+            stored = qfsFormat.write_qfs(output_path, file_metadata, file, extra_chunks=extra_chunks,
+                                         chunk_store=chunkStore.ChunkStore(chunk_store))
+            print(f"Chunk store: {stored.new_chunks} of {len(stored.chunks)} chunks new, "
+                  f"{stored.new_bytes / 1e6:.2f} of {stored.payload_size / 1e6:.2f} MB written")
+        else:
+            qfsFormat.write_qfs(output_path, file_metadata, file, codec=codec, level=level, extra_chunks=extra_chunks)
 
 
 # EXCEL CONVERSION
@@ -162,13 +203,13 @@ def convert_pdf(file_path, output_path):
 # ANY FORMAT CONVERSION
 # This function will determine the file type and call the appropriate conversion function
 # IF AND ELSE STATEMENTS
-def convert_to_custom_format(file_path, output_path):
+def convert_to_custom_format(file_path, output_path, **options):
     # Get the file extension
-    file_extension = file_path.split(".")[-1]
+    file_extension = file_path.split(".")[-1].lower()
 
     # Check the file extension and call the appropriate conversion function
     if file_extension == "pdf":
-        convert_pdf(file_path, output_path)
+        convert_pdf(file_path, output_path, **options)
     ##elif file_extension == "docx":
     ##    convert_docx(file_path, output_path)
     ##elif file_extension == "pptx":
@@ -183,7 +224,155 @@ def convert_to_custom_format(file_path, output_path):
 
 #convert_to_custom_format(r"C:\Users\HR-IT-MATTHEW-PC\Desktop\Projects\Applications\AntiCopyPaste\try.docx", "docx.myext")
 
-def main():
+
+# BATCH CONVERSION
+def glob_root(pattern):
+    """Leading folders of a glob pattern that contain no wildcards, the folder the matches are relative to."""
+    root = os.path.dirname(pattern)
+    while root and glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or "."
+
+
+def collect_sources(inputs, extension=".pdf"):
+    """Expand files, directories (searched recursively) and glob patterns into (source, relative output dir) pairs."""
+    sources = []
+    seen = set()
+
+    def add(path, relative_dir):
+        if os.path.abspath(path) not in seen:
+            seen.add(os.path.abspath(path))
+            sources.append((path, relative_dir))
+
+    for item in inputs:
+        if os.path.isdir(item):
+            for folder, _, names in os.walk(item):
+                for name in sorted(names):
+                    if name.lower().endswith(extension):
+                        add(os.path.join(folder, name), os.path.relpath(folder, item))
+        else:
+            # Matches keep their folder below the glob root, so equal names in different folders do not collide
+            root = glob_root(item)
+            for path in sorted(glob.glob(item, recursive=True)) or [item]:
+                if os.path.isfile(path) and path.lower().endswith(extension):
+                    add(path, os.path.relpath(os.path.dirname(path) or ".", root))
+    return sources
+
+
+def output_path_for(source, relative_dir, output_dir, extension=".QFS"):
+    name = os.path.splitext(os.path.basename(source))[0] + extension
+    return os.path.normpath(os.path.join(output_dir, relative_dir, name))
+
+
+def is_up_to_date(source, output_path, check="mtime"):
+    """Check whether `output_path` was converted from the current version of `source`."""
+    if not os.path.exists(output_path):
+        return False
+    if check == "mtime":
+        return os.path.getmtime(output_path) >= os.path.getmtime(source)
+    try:
+        recorded = qfsFormat.read_metadata(output_path).get("payload_sha256")
+    except Exception:
+        return False
+    return recorded == qfsFormat.file_sha256(source)
+
+
+def convert_one(source, output_path, options):
+    """Convert a single file in a worker process and return (seconds, input bytes, output bytes)."""
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    convert_to_custom_format(source, output_path, **options)
+    return time.perf_counter() - start, os.path.getsize(source), os.path.getsize(output_path)
+
+
+def batch_convert(inputs, output_dir, jobs=None, check="mtime", force=False, extension=".QFS", options=None):
+    """
+    Convert every PDF found in `inputs` into `output_dir` with a pool of `jobs` processes.
+
+    `options` are passed on to convert_pdf (format_version, codec, level, thumbnails, chunk_store).
+    """
+    options = options or {}
+    planned = []
+    skipped = 0
+    failed = 0
+    outputs = {}  # normalized output path -> source
+    for source, relative_dir in collect_sources(inputs):
+        output_path = output_path_for(source, relative_dir, output_dir, extension)
+        # Two processes writing the same output would clobber each other
+        other = outputs.setdefault(os.path.normcase(os.path.abspath(output_path)), source)
+        if other != source:
+            failed += 1
+            print(f"FAILED      {source}: {other} is also converted to {output_path}")
+            continue
+        if not force and is_up_to_date(source, output_path, check):
+            skipped += 1
+            print(f"up to date  {source}")
+        else:
+            planned.append((source, output_path))
+
+    converted = 0
+    bytes_in = 0
+    bytes_out = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(convert_one, source, output_path, options): source
+                   for source, output_path in planned}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                seconds, size_in, size_out = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"FAILED      {source}: {e}")
+                continue
+            converted += 1
+            bytes_in += size_in
+            bytes_out += size_out
+            print(f"converted   {source}  {seconds:.2f}s  {size_in / 1e6:.1f} MB -> {size_out / 1e6:.1f} MB")
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{converted} converted, {skipped} up to date, {failed} failed in {elapsed:.2f}s")
+    if converted and elapsed > 0:
+        print(f"Throughput: {converted / elapsed:.1f} files/s, {bytes_in / 1e6 / elapsed:.1f} MB/s")
+    return failed == 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Convert PDF files to QFS. Without arguments a file dialog is shown.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories (searched recursively) or glob patterns")
+    parser.add_argument("-o", "--output-dir", default=".", help="directory for the converted files (default: current directory)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of conversion processes (default: CPU count)")
+    parser.add_argument("--check", choices=("mtime", "hash"), default="mtime",
+                        help="how to decide that an existing output is up to date (default: mtime)")
+    parser.add_argument("--force", action="store_true", help="convert even when the output is up to date")
+    parser.add_argument("--extension", default=".QFS", help="extension of the converted files (default: .QFS)")
+    parser.add_argument("--format-version", type=int, choices=(qfsFormat.LEGACY_VERSION, qfsFormat.FORMAT_VERSION),
+                        default=qfsFormat.FORMAT_VERSION,
+                        help="1 writes the original JSON layout for older viewers (default: %(default)s)")
+    parser.add_argument("--compress", choices=qfsFormat.CODECS, default=qfsFormat.DEFAULT_CODEC,
+                        help="payload compression, zstd needs the zstandard package (default: %(default)s)")
+    parser.add_argument("--level", type=int, default=None, help="compression level (default: codec default)")
+    parser.add_argument("--no-thumbnails", action="store_true", help="do not store page thumbnails in the QFS files")
+    parser.add_argument("--chunk-store", nargs="?", const="", default=None, metavar="DIR",
+                        help="store the payloads in a shared, deduplicated chunk store (default folder: "
+                             "QFS_CHUNK_STORE or %%APPDATA%%/CFV/chunk store); the viewer needs the same store")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # Batch mode when files or directories are given on the command line
+    if argv:
+        args = parse_args(argv)
+        options = {"format_version": args.format_version, "codec": args.compress, "level": args.level,
+                   "thumbnails": not args.no_thumbnails}
+        if args.chunk_store is not None:
+            import chunkStore
+            options["chunk_store"] = args.chunk_store or chunkStore.default_store_path()
+        ok = batch_convert(args.inputs, args.output_dir, args.jobs, args.check, args.force, args.extension, options)
+        return 0 if ok else 1
+
+    from tkinter import Tk, filedialog
+
     root = Tk()
     root.withdraw()  # Hide the root window
     file_path = filedialog.askopenfilename(
@@ -206,7 +395,7 @@ def main():
         print("File selection cancelled.")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main(sys.argv[1:]))
 
 
     ## NOT3 ALL THE FUNCTIONS ARE COMMENTED OUT BECAUSE THEY ARE NOT USED IN THE MAIN FUNCTION AND WILL CAUSE ERRORS ON
@@ -0,0 +1,156 @@
+"""
+Content-addressed store of payload chunks shared by QFS files.
+
+Controlled documents are reissued many times with small changes. When the
+converter writes a file in chunk store mode (see qfsFormat CREF), the
+payload is cut into chunks and every chunk is stored once, under the
+SHA-256 of its content, in a local store folder. The QFS file only lists
+the hashes, so a new revision costs the chunks that actually changed.
+
+Chunk boundaries are content-defined: a chunk ends at the first PDF object
+header ("12 0 obj" at the start of a line) found at least MIN_CHUNK_SIZE
+bytes after the start of the chunk, or after MAX_CHUNK_SIZE bytes when
+there is none. Boundaries therefore follow the objects of the document
+rather than their offsets, and an edit early in the file does not shift
+every chunk after it. Payloads that are not PDFs are cut in
+MAX_CHUNK_SIZE blocks.
+
+Layout of the store:
+
+    <root>/objects/<first 2 hex digits>/<remaining 62 hex digits>
+
+Each object is the chunk compressed with zlib. Reads are verified: a chunk
+whose content does not hash to its name raises ChunkStoreError.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import zlib
+
+
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 512 * 1024
+READ_SIZE = 1024 * 1024
+COMPRESS_LEVEL = 6
+
+# Start of an indirect object on a new line, the boundary is placed after the line break
+_OBJECT_HEADER = re.compile(rb"[\r\n]\d{1,10} \d{1,5} obj\b")
+_LONGEST_HEADER = 24
+
+
+class ChunkStoreError(ValueError):
+    """Raised when a chunk is missing from the store or does not match its hash."""
+
+
+def default_store_path():
+    """QFS_CHUNK_STORE if set, otherwise the chunk store folder in the CFV folder of %APPDATA%."""
+    return os.environ.get("QFS_CHUNK_STORE") or os.path.join(
+        os.getenv("APPDATA") or os.path.expanduser("~"), "CFV", "chunk store")
+
+
+def find_boundary(buffer, at_end, start=0):
+    """Length of the next chunk starting at `start` in `buffer`, or None if more data is needed to decide."""
+    available = len(buffer) - start
+    match = _OBJECT_HEADER.search(buffer, start + MIN_CHUNK_SIZE - 1, start + MAX_CHUNK_SIZE + _LONGEST_HEADER)
+    if match is not None and match.start() + 1 - start <= MAX_CHUNK_SIZE:
+        # "\b" also matches at the end of the buffer, wait for the next byte to be sure
+        if match.end() >= len(buffer) and not at_end:
+            return None
+        return match.start() + 1 - start
+    if available >= MAX_CHUNK_SIZE + _LONGEST_HEADER:
+        return MAX_CHUNK_SIZE
+    if at_end:
+        return min(available, MAX_CHUNK_SIZE)
+    return None
+
+
+def iter_chunks(source, read_size=READ_SIZE):
+    """Cut the binary file object `source` into content-defined chunks."""
+    # Chunks are cut at an offset into the buffer, the consumed part is only dropped when reading more
+    buffer = b""
+    start = 0
+    at_end = False
+    while start < len(buffer) or not at_end:
+        cut = find_boundary(buffer, at_end, start) if start < len(buffer) else None
+        if cut is None:
+            block = source.read(read_size)
+            if block:
+                buffer = buffer[start:] + block
+                start = 0
+            else:
+                at_end = True
+            continue
+        yield buffer[start:start + cut]
+        start += cut
+
+
+class StoreResult:
+    """What put_stream stored: the chunk list of the payload, its SHA-256 and the bytes actually written."""
+
+    def __init__(self):
+        self.chunks = []  # [sha256 hex digest, size] in payload order
+        self.sha256 = None
+        self.payload_size = 0
+        self.new_bytes = 0  # Size of the chunks that were not in the store yet
+        self.new_chunks = 0
+
+
+class ChunkStore:
+    def __init__(self, root=None):
+        self.root = root or default_store_path()
+
+    def chunk_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest[2:])
+
+    def has(self, digest):
+        return os.path.exists(self.chunk_path(digest))
+
+    def put(self, data):
+        """Store one chunk, returns (digest, True if it was new)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return digest, False
+
+        folder = os.path.dirname(path)
+        os.makedirs(folder, exist_ok=True)
+        # Written next to its final name and renamed, so readers and other converters never see half a chunk
+        descriptor, temporary_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as chunk_file:
+                chunk_file.write(zlib.compress(data, COMPRESS_LEVEL))
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        return digest, True
+
+    def put_stream(self, source):
+        """Chunk and store the binary file object `source`, hashing the whole payload on the way."""
+        result = StoreResult()
+        payload_digest = hashlib.sha256()
+        for chunk in iter_chunks(source):
+            payload_digest.update(chunk)
+            digest, new = self.put(chunk)
+            result.chunks.append([digest, len(chunk)])
+            result.payload_size += len(chunk)
+            if new:
+                result.new_bytes += len(chunk)
+                result.new_chunks += 1
+        result.sha256 = payload_digest.hexdigest()
+        return result
+
+    def get(self, digest, size=None):
+        """Read a chunk and check it against its hash and, if given, its size."""
+        try:
+            with open(self.chunk_path(digest), "rb") as chunk_file:
+                data = zlib.decompress(chunk_file.read())
+        except FileNotFoundError:
+            raise ChunkStoreError(f"Chunk {digest} is missing from the chunk store {self.root}") from None
+        except zlib.error as e:
+            raise ChunkStoreError(f"Chunk {digest} in {self.root} is corrupt: {e}") from None
+        if hashlib.sha256(data).hexdigest() != digest or (size is not None and len(data) != size):
+            raise ChunkStoreError(f"Chunk {digest} in {self.root} does not match its hash")
+        return data
@@ -0,0 +1,108 @@
+"""
+Reading of QFS files off the GUI thread.
+
+Opening many files at once used to read them one after another on the GUI
+thread. DocumentLoader reads them in a pool of threads instead, and each
+finished file is delivered with fileLoaded while the window stays
+responsive. The file reads, zlib and zstd decompression and the SHA-256 of
+the payload release the GIL, so v2 files are read in parallel. Base64
+decoding does not, and the unescaping of the JSON layout is plain Python,
+so legacy files still take turns on the GIL; convert them to v2 to open
+them in parallel.
+
+fitz is not safe to use from several threads, so opening the PDF is left
+to the GUI thread (viewerDocument).
+"""
+import hashlib
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import instrumentation
+import qfsFormat
+
+
+def default_loader_threads():
+    return max(2, min(4, os.cpu_count() or 2))
+
+
+class LoadedFile:
+    """Everything the viewer needs from a QFS file to show it."""
+
+    def __init__(self, path, metadata, payload, page_index, thumbnails, payload_sha256):
+        self.path = path
+        self.metadata = metadata
+        self.payload = payload
+        self.page_index = page_index  # None for files without a page index
+        self.thumbnails = thumbnails  # [] for files without thumbnails
+        self.payload_sha256 = payload_sha256
+
+    @property
+    def file_name(self):
+        return self.metadata["file_name"]
+
+    @property
+    def original_type(self):
+        return self.metadata["original_type"]
+
+
+def read_qfs_file(path):
+    """Read the metadata, payload, page index and thumbnails of a QFS file and hash its payload."""
+    with qfsFormat.QFSReader(path) as reader:
+        metadata = reader.metadata
+        # Fail here, off the GUI thread, on files without the fields the viewer needs
+        missing = [field for field in ("original_type", "file_name") if field not in metadata]
+        if missing:
+            raise qfsFormat.QFSFormatError(f"{path} has no {', '.join(missing)} in its metadata")
+
+        # The payload stays in memory, nothing is extracted to disk
+        with instrumentation.span("read"):
+            payload = reader.read_payload()
+        instrumentation.count("read", "bytes", len(payload))
+
+        # Page sizes and thumbnails stored by the converter, None / [] for older files
+        page_index = reader.read_page_index()
+        thumbnails = reader.read_thumbnails()
+
+        # Payloads from the chunk store were already checked against their hash
+        payload_sha256 = reader.verified_sha256
+    if payload_sha256 is None:
+        with instrumentation.span("payload hash"):
+            payload_sha256 = hashlib.sha256(payload).hexdigest()
+    return LoadedFile(path, metadata, payload, page_index, thumbnails, payload_sha256)
+
+
+class DocumentLoader(QObject):
+    """Read QFS files in a thread pool and deliver them to the GUI thread through signals."""
+
+    # request id, LoadedFile
+    fileLoaded = pyqtSignal(int, object)
+    # request id, path, error message
+    fileFailed = pyqtSignal(int, str, str)
+
+    def __init__(self, thread_count=None, parent=None):
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(max_workers=thread_count or default_loader_threads(),
+                                           thread_name_prefix="qfs-loader")
+        self.request_ids = itertools.count(1)
+
+    def load(self, path):
+        """Start reading `path`, returns the request id that fileLoaded or fileFailed will carry."""
+        request_id = next(self.request_ids)
+        self.executor.submit(self._load, request_id, path)
+        return request_id
+
+    def _load(self, request_id, path):
+        # Signals emitted from a pool thread are queued to the GUI thread
+        try:
+            loaded = read_qfs_file(path)
+        except Exception as e:
+            self.fileFailed.emit(request_id, path, str(e))
+            return
+        self.fileLoaded.emit(request_id, loaded)
+
+    def shutdown(self):
+        """Drop the files not started yet, files being read finish in the background."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,174 @@
+"""
+Recent files and folder browser shown in a dock of the viewer.
+
+Every row is filled from qfsFormat.read_header, which only reads the header
+and the metadata of a file, so listing hundreds of files does not touch
+their payloads. Headers are cached by path, size and modification time.
+"""
+import json
+import logging
+import os
+
+from PyQt5.QtWidgets import QDockWidget, QTreeWidget, QTreeWidgetItem, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog, QLabel
+from PyQt5.QtCore import Qt, pyqtSignal
+
+import qfsFormat
+
+
+MAX_RECENT_FILES = 50
+COLUMNS = ["Name", "Author", "Created", "Page Size", "Orientation", "Folder"]
+
+
+def recent_files_path():
+    return os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "CFV", "recent_files.json")
+
+
+def format_pdf_date(value):
+    """Turn a PDF date such as D:20240131093000+08'00' into 2024-01-31 09:30."""
+    if not value:
+        return ""
+    digits = value[2:] if value.startswith("D:") else value
+    if len(digits) >= 12 and digits[:12].isdigit():
+        return f"{digits[0:4]}-{digits[4:6]}-{digits[6:8]} {digits[8:10]}:{digits[10:12]}"
+    if len(digits) >= 8 and digits[:8].isdigit():
+        return f"{digits[0:4]}-{digits[4:6]}-{digits[6:8]}"
+    return value
+
+
+class HeaderCache:
+    """read_header results keyed by path, read again when the size or modification time changes."""
+
+    def __init__(self):
+        self.entries = {}  # path -> (size, mtime, header)
+
+    def get(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            return entry[2]
+        try:
+            header = qfsFormat.read_header(path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read the header of {path}: {e}")
+            header = None
+        self.entries[path] = (stat.st_size, stat.st_mtime, header)
+        return header
+
+
+class FileBrowserDock(QDockWidget):
+    """Dock listing the recent files, or the .QFS files of a folder, with their metadata."""
+
+    fileActivated = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__("Files", parent)
+        self.setObjectName("fileBrowserDock")
+        self.header_cache = HeaderCache()
+        self.recent_files = self.load_recent_files()
+        self.folder = None  # Folder listed instead of the recent files
+
+        widget = QWidget(self)
+        layout = QVBoxLayout(widget)
+        layout.setContentsMargins(4, 4, 4, 4)
+
+        buttons = QHBoxLayout()
+        self.recent_button = QPushButton("Recent Files", widget)
+        self.recent_button.clicked.connect(self.show_recent_files)
+        buttons.addWidget(self.recent_button)
+        self.folder_button = QPushButton("Open Folder...", widget)
+        self.folder_button.clicked.connect(self.choose_folder)
+        buttons.addWidget(self.folder_button)
+        layout.addLayout(buttons)
+
+        self.source_label = QLabel(widget)
+        layout.addWidget(self.source_label)
+
+        self.tree = QTreeWidget(widget)
+        self.tree.setHeaderLabels(COLUMNS)
+        self.tree.setRootIsDecorated(False)
+        self.tree.setSortingEnabled(True)
+        self.tree.setUniformRowHeights(True)
+        self.tree.itemActivated.connect(lambda item, column: self.fileActivated.emit(item.data(0, Qt.UserRole)))
+        layout.addWidget(self.tree)
+
+        self.setWidget(widget)
+        self.refresh()
+
+    def load_recent_files(self):
+        try:
+            with open(recent_files_path(), "r") as recent_file:
+                return [path for path in json.load(recent_file) if isinstance(path, str)]
+        except (OSError, ValueError):
+            return []
+
+    def save_recent_files(self):
+        path = recent_files_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as recent_file:
+                json.dump(self.recent_files, recent_file)
+        except OSError as e:
+            logging.warning(f"Could not save the recent files: {e}")
+
+    def add_recent(self, path):
+        """Move `path` to the top of the recent files."""
+        path = os.path.abspath(path)
+        if path in self.recent_files:
+            self.recent_files.remove(path)
+        self.recent_files.insert(0, path)
+        del self.recent_files[MAX_RECENT_FILES:]
+        self.save_recent_files()
+        if self.folder is None:
+            self.refresh()
+
+    def show_recent_files(self):
+        self.folder = None
+        self.refresh()
+
+    def choose_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Select a Folder of QFS Files", self.folder or "")
+        if folder:
+            self.folder = folder
+            self.refresh()
+
+    def list_paths(self):
+        if self.folder is None:
+            return [path for path in self.recent_files if os.path.isfile(path)]
+        try:
+            names = sorted(os.listdir(self.folder))
+        except OSError as e:
+            logging.warning(f"Could not list {self.folder}: {e}")
+            return []
+        return [os.path.join(self.folder, name) for name in names if name.upper().endswith(".QFS")]
+
+    def refresh(self):
+        paths = self.list_paths()
+        self.source_label.setText(f"{self.folder} ({len(paths)} files)" if self.folder else f"Recent files ({len(paths)})")
+
+        self.tree.setSortingEnabled(False)
+        self.tree.clear()
+        items = []
+        for path in paths:
+            header = self.header_cache.get(path)
+            if header is None:
+                continue
+            metadata = header["metadata"]
+            width, height = metadata.get("width", ""), metadata.get("height", "")
+            item = QTreeWidgetItem([
+                metadata.get("file_name", os.path.basename(path)),
+                metadata.get("author", ""),
+                format_pdf_date(metadata.get("creation_date", "")),
+                f"{width} x {height}" if width and height else "",
+                metadata.get("orientation", ""),
+                os.path.dirname(path),
+            ])
+            item.setData(0, Qt.UserRole, path)
+            item.setToolTip(0, path)
+            items.append(item)
+        self.tree.addTopLevelItems(items)
+        self.tree.setSortingEnabled(self.folder is not None)
+        for column in range(len(COLUMNS) - 1):
+            self.tree.resizeColumnToContents(column)
@@ -0,0 +1,200 @@
+"""
+Per-stage timing of the viewer.
+
+The hot paths are wrapped in named spans: reading a QFS file, parsing its
+metadata, decoding a base64 payload, opening it with fitz, rasterizing a
+page in a render worker, building the QImage, laying out the pages and
+painting them on the printer. Every span name collects a call count, the
+total, minimum and maximum time, a histogram of durations and any counters
+added to it, such as bytes read or pages rendered.
+
+Instrumentation is off unless the viewer is started with --instrument or
+with QFS_INSTRUMENT=1 in the environment. While it is off, span() returns a
+shared object whose __enter__ and __exit__ do nothing and count() returns
+right away, so the spans can stay in the hot loops.
+
+    with instrumentation.span("read"):
+        payload = reader.read_payload()
+    instrumentation.count("read", "bytes", len(payload))
+
+The collected stats are exported with export_json() or export_csv(), and
+shown in the stats panel of the viewer (statsPanel.py). Spans are recorded
+from the file loader threads as well as the GUI thread, so the stats are
+only changed and copied while holding a lock.
+"""
+import csv
+import json
+import os
+import sys
+import threading
+import time
+
+
+INSTRUMENT_FLAG = "--instrument"
+
+# Upper bounds of the histogram buckets in seconds, from 10 us to 10 s; longer spans go in a last bucket
+BUCKET_BOUNDS = tuple(10 ** (exponent / 2) * 1e-5 for exponent in range(13))
+
+
+class SpanStats:
+    """Durations and counters collected for one span name."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.counters = {}
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        self.minimum = seconds if self.minimum is None else min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+        for index, bound in enumerate(BUCKET_BOUNDS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the `fraction` quantile, an estimate from the histogram."""
+        if self.calls == 0:
+            return 0.0
+        rank = fraction * self.calls
+        seen = 0
+        for index, bucket in enumerate(self.buckets[:-1]):
+            seen += bucket
+            if seen >= rank:
+                return min(BUCKET_BOUNDS[index], self.maximum)
+        return self.maximum
+
+    def as_dict(self):
+        histogram = {f"<={bound:g}": count for bound, count in zip(BUCKET_BOUNDS, self.buckets)}
+        histogram[f">{BUCKET_BOUNDS[-1]:g}"] = self.buckets[-1]
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "total_seconds": self.total,
+            "mean_seconds": self.total / self.calls if self.calls else 0.0,
+            "min_seconds": self.minimum or 0.0,
+            "max_seconds": self.maximum,
+            "p50_seconds": self.percentile(0.5),
+            "p95_seconds": self.percentile(0.95),
+            "histogram": histogram,
+            "counters": dict(self.counters),
+        }
+
+
+class _Span:
+    __slots__ = ("stats", "start")
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        with _lock:
+            self.stats.add(seconds)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+_enabled = False
+_stats = {}  # span name -> SpanStats
+_lock = threading.Lock()  # Guards _stats and the SpanStats in it
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enable_if_requested(argv=None):
+    """Enable instrumentation if the command line or the environment asks for it."""
+    argv = sys.argv if argv is None else argv
+    if INSTRUMENT_FLAG in argv or os.environ.get("QFS_INSTRUMENT", "") not in ("", "0"):
+        enable()
+
+
+def _get_stats(name):
+    """SpanStats of `name`, created on first use; call with _lock held."""
+    stats = _stats.get(name)
+    if stats is None:
+        stats = _stats[name] = SpanStats(name)
+    return stats
+
+
+def span(name):
+    """Context manager timing a stage under `name`, does nothing while instrumentation is off."""
+    if not _enabled:
+        return _NULL_SPAN
+    with _lock:
+        return _Span(_get_stats(name))
+
+
+def record(name, seconds):
+    """Add a duration measured elsewhere, for example in a render worker, to the span `name`."""
+    if _enabled:
+        with _lock:
+            _get_stats(name).add(seconds)
+
+
+def count(name, counter, value=1):
+    """Add `value` to a counter of the span `name`."""
+    if _enabled:
+        with _lock:
+            counters = _get_stats(name).counters
+            counters[counter] = counters.get(counter, 0) + value
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def snapshot():
+    """Stats of every span as a list of dicts, in the order the spans were first used."""
+    with _lock:
+        return [stats.as_dict() for stats in _stats.values()]
+
+
+def export_json(path):
+    with open(path, "w") as output_file:
+        json.dump({"spans": snapshot()}, output_file, indent=2)
+
+
+def export_csv(path):
+    """One row per span, counters in a column of their own as name=value pairs."""
+    columns = ["name", "calls", "total_seconds", "mean_seconds", "min_seconds", "max_seconds", "p50_seconds", "p95_seconds"]
+    with open(path, "w", newline="") as output_file:
+        writer = csv.writer(output_file)
+        writer.writerow(columns + ["counters"])
+        for row in snapshot():
+            counters = " ".join(f"{name}={value}" for name, value in row["counters"].items())
+            writer.writerow([row[column] for column in columns] + [counters])
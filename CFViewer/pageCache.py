@@ -0,0 +1,116 @@
+from collections import OrderedDict
+
+
+# Memory budgets of the cache tiers in MB
+DEFAULT_BUDGETS_MB = {
+    "screen": 256,  # QPixmaps shown in the viewer tabs
+    "preview": 128,  # QPixmaps of the print preview at preview resolution
+    "tiles": 128,  # QPixmap tiles of large pages shown in the viewer
+    "thumbnails": 32,  # QPixmaps of the thumbnail sidebars, kept apart so full pages do not evict them
+}
+
+
+def page_key(doc_hash, page_number, zoom=1.0, dpi=72):
+    """Cache key of a rendered page, `doc_hash` is the content hash of the QFS payload."""
+    return (doc_hash, page_number, round(float(zoom), 3), round(float(dpi), 3))
+
+
+def tile_key(doc_hash, page_number, dpi, column, row):
+    """Cache key of one tile of a page rendered in tiles, see tileRenderer."""
+    return (doc_hash, page_number, round(float(dpi), 3), column, row)
+
+
+def thumbnail_key(doc_hash, page_number):
+    """Cache key of the sidebar thumbnail of a page."""
+    return (doc_hash, page_number, "thumbnail")
+
+
+def image_nbytes(image):
+    """Approximate memory used by a QImage or QPixmap."""
+    return image.width() * image.height() * max(image.depth(), 8) // 8
+
+
+class PageCache:
+    """
+    Least recently used cache of rendered pages with a memory budget per tier.
+
+    Screen, preview and thumbnail renders live in separate tiers so one kind
+    does not evict the pages of another. Print rasters are not cached, a
+    print job streams its pages and releases each one once painted. Entries
+    are keyed with page_key(), so the same document opened twice or shown in
+    another tab reuses the pages already rendered.
+    """
+
+    def __init__(self, budgets_mb=None):
+        budgets_mb = dict(DEFAULT_BUDGETS_MB, **(budgets_mb or {}))
+        self.tiers = {tier: OrderedDict() for tier in budgets_mb}  # key -> (value, nbytes)
+        self.budgets = {}
+        self.used = {tier: 0 for tier in budgets_mb}
+        self.hits = {tier: 0 for tier in budgets_mb}
+        self.misses = {tier: 0 for tier in budgets_mb}
+        self.evictions = {tier: 0 for tier in budgets_mb}
+        for tier, budget_mb in budgets_mb.items():
+            self.set_budget(tier, budget_mb)
+
+    def set_budget(self, tier, budget_mb):
+        """Change the memory budget of a tier, evicting entries if it shrinks."""
+        self.budgets[tier] = int(budget_mb * 1024 * 1024)
+        self._evict(tier)
+
+    def get(self, tier, key):
+        entries = self.tiers[tier]
+        entry = entries.get(key)
+        if entry is None:
+            self.misses[tier] += 1
+            return None
+        entries.move_to_end(key)
+        self.hits[tier] += 1
+        return entry[0]
+
+    def put(self, tier, key, value, nbytes=None):
+        """Store a rendered page, values larger than the whole budget are not cached."""
+        if nbytes is None:
+            nbytes = image_nbytes(value)
+        if nbytes > self.budgets[tier]:
+            return
+        self.remove(tier, key)
+        self.tiers[tier][key] = (value, nbytes)
+        self.used[tier] += nbytes
+        self._evict(tier)
+
+    def remove(self, tier, key):
+        entry = self.tiers[tier].pop(key, None)
+        if entry is not None:
+            self.used[tier] -= entry[1]
+
+    def discard_document(self, doc_hash):
+        """Drop every entry of a document from all tiers."""
+        for tier, entries in self.tiers.items():
+            for key in [key for key in entries if key[0] == doc_hash]:
+                self.remove(tier, key)
+
+    def clear(self):
+        for tier, entries in self.tiers.items():
+            entries.clear()
+            self.used[tier] = 0
+
+    def _evict(self, tier):
+        entries = self.tiers[tier]
+        while self.used[tier] > self.budgets[tier] and entries:
+            _, (_, nbytes) = entries.popitem(last=False)
+            self.used[tier] -= nbytes
+            self.evictions[tier] += 1
+
+    def stats(self):
+        """Return the counters and memory use of every tier."""
+        return {
+            tier: {
+                "entries": len(self.tiers[tier]),
+                "used_mb": self.used[tier] / (1024 * 1024),
+                "budget_mb": self.budgets[tier] / (1024 * 1024),
+                "hits": self.hits[tier],
+                "misses": self.misses[tier],
+                "evictions": self.evictions[tier],
+            }
+            for tier in self.tiers
+        }
@@ -0,0 +1,309 @@
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtCore import QObject, QEvent, QTimer, QRectF, pyqtSignal
+from PyQt5.QtGui import QPixmap, QPainter
+
+from pageCache import page_key, tile_key
+from renderService import PRIORITY_VISIBLE, PRIORITY_PREFETCH
+from tileRenderer import needs_tiling, tile_clip, tiles_in_rect
+
+
+MIN_ZOOM = 0.25
+MAX_ZOOM = 8.0
+
+
+class PageLabel(QLabel):
+    """Placeholder of a page, shows either the whole page as its pixmap or the tiles rendered so far."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tiles = {}  # (column, row) -> (QRectF in label pixels, QPixmap)
+
+    def set_tile(self, tile, rect, pixmap):
+        self.tiles[tile] = (rect, pixmap)
+        self.update(rect.toAlignedRect())
+
+    def remove_tile(self, tile):
+        entry = self.tiles.pop(tile, None)
+        if entry is not None:
+            self.update(entry[0].toAlignedRect())
+
+    def clear_tiles(self):
+        if self.tiles:
+            self.tiles.clear()
+            self.update()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.tiles:
+            return
+        painter = QPainter(self)
+        exposed = QRectF(event.rect())
+        for rect, pixmap in self.tiles.values():
+            if rect.intersects(exposed):
+                painter.drawPixmap(rect, pixmap, QRectF(pixmap.rect()))
+        painter.end()
+
+
+class LazyPageLoader(QObject):
+    """
+    Keep only the pages near the visible part of a QScrollArea rendered.
+
+    Every page has a placeholder QLabel that already has the final size of the
+    page, so the scroll area has its full height from the start. Pages on
+    screen are queued on the render service first, pages within
+    `prefetch_screens` viewport heights after them. Pages further than
+    `drop_screens` viewport heights away have their bitmap released from
+    the label; it stays in the "screen" tier of the page cache until evicted.
+
+    Pages that would be larger than TILE_THRESHOLD_PIXELS at their current
+    zoom are rendered in tiles instead, and only the tiles in or near the
+    view are requested. Tiles live in the "tiles" tier of the cache.
+
+    currentPageChanged reports the page at the top of the view.
+    """
+
+    currentPageChanged = pyqtSignal(int)
+
+    def __init__(self, render_service, doc_key, page_cache, doc_hash, page_sizes, scroll_area, page_labels, prefetch_screens=1, drop_screens=3, parent=None):
+        super().__init__(parent if parent is not None else scroll_area)
+        self.render_service = render_service
+        self.doc_key = doc_key
+        self.page_cache = page_cache
+        self.doc_hash = doc_hash
+        self.page_sizes = page_sizes
+        self.scroll_area = scroll_area
+        self.page_labels = page_labels
+        self.prefetch_screens = prefetch_screens
+        self.drop_screens = drop_screens
+        self.rendered = set()
+        self.requested = {}  # page number -> (render job id, dpi)
+        self.tiled_pages = set()  # Pages showing at least one tile
+        self.requested_tiles = {}  # (page number, dpi, clip) -> (column, row, render job id)
+        self.zoom = 1.0
+        self.base_sizes = [(label.width(), label.height()) for label in page_labels]
+        self.current_page = -1
+        self.jumped_page = None  # Page scrolled to by scroll_to_page, current while it stays in view
+
+        # Coalesce bursts of scroll and resize events into one update
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(15)
+        self.update_timer.timeout.connect(self.update_visible_pages)
+
+        scroll_bar = scroll_area.verticalScrollBar()
+        scroll_bar.valueChanged.connect(self.schedule_update)
+        scroll_bar.rangeChanged.connect(self.schedule_update)
+        scroll_area.viewport().installEventFilter(self)
+        render_service.pageRendered.connect(self.on_page_rendered)
+        render_service.tileRendered.connect(self.on_tile_rendered)
+
+    def eventFilter(self, obj, event):
+        if event.type() in (QEvent.Show, QEvent.Resize):
+            self.schedule_update()
+        return super().eventFilter(obj, event)
+
+    def schedule_update(self, *args):
+        self.update_timer.start()
+
+    def visible_range(self, margin_screens):
+        """Return the (top, bottom) range of the scrolled widget covered by the view plus a margin."""
+        viewport_height = self.scroll_area.viewport().height()
+        top = self.scroll_area.verticalScrollBar().value()
+        margin = viewport_height * margin_screens
+        return top - margin, top + viewport_height + margin
+
+    def page_dpi(self, page_num):
+        """DPI at which a page exactly fills its placeholder."""
+        return 72 * self.page_labels[page_num].width() / self.page_sizes[page_num][0]
+
+    def cache_key(self, page_num):
+        return page_key(self.doc_hash, page_num, zoom=self.zoom, dpi=self.page_dpi(page_num))
+
+    def is_tiled(self, page_num):
+        return needs_tiling(self.page_sizes[page_num], self.page_dpi(page_num))
+
+    def view_rect(self, label, margin_screens):
+        """Part of a page label covered by the view plus a margin, as (x0, y0, x1, y1) in label pixels."""
+        viewport = self.scroll_area.viewport()
+        left = self.scroll_area.horizontalScrollBar().value() - label.x()
+        top, bottom = self.visible_range(margin_screens)
+        margin = viewport.width() * margin_screens
+        return (left - margin, top - label.y(), left + viewport.width() + margin, bottom - label.y())
+
+    def update_visible_pages(self):
+        """Request the pages in or near the view and release the ones far away from it."""
+        # Geometry is meaningless until the tab is actually shown
+        if not self.scroll_area.viewport().isVisible():
+            return
+
+        view_top, view_bottom = self.visible_range(0)
+        render_top, render_bottom = self.visible_range(self.prefetch_screens)
+        keep_top, keep_bottom = self.visible_range(self.drop_screens)
+        self.update_current_page(view_top, view_bottom)
+
+        for page_num, label in enumerate(self.page_labels):
+            page_top = label.y()
+            page_bottom = page_top + label.height()
+
+            if page_bottom >= render_top and page_top <= render_bottom:
+                if self.is_tiled(page_num):
+                    self.update_tiles(page_num, label)
+                    continue
+                if page_num in self.rendered:
+                    continue
+                on_screen = page_bottom >= view_top and page_top <= view_bottom
+                priority = PRIORITY_VISIBLE if on_screen else PRIORITY_PREFETCH
+                request = self.requested.get(page_num)
+                # A page already queued only gets its priority raised, a failed one is submitted again
+                if request is not None and self.render_service.raise_priority(request[0], priority):
+                    continue
+                if request is None:
+                    pixmap = self.page_cache.get("screen", self.cache_key(page_num))
+                    if pixmap is not None:
+                        self.show_page(page_num, pixmap)
+                        continue
+                dpi = float(self.page_dpi(page_num))
+                self.requested[page_num] = (self.render_service.submit(self.doc_key, page_num, dpi, priority), dpi)
+            elif page_bottom < keep_top or page_top > keep_bottom:
+                self.release_page(page_num)
+
+    def update_current_page(self, view_top, view_bottom):
+        current = None
+        if self.jumped_page is not None:
+            label = self.page_labels[self.jumped_page]
+            if label.y() + label.height() >= view_top and label.y() <= view_bottom:
+                current = self.jumped_page
+            else:
+                self.jumped_page = None
+        if current is None:
+            current = next((page_num for page_num, label in enumerate(self.page_labels)
+                            if label.y() + label.height() > view_top), len(self.page_labels) - 1)
+        if current != self.current_page:
+            self.current_page = current
+            self.currentPageChanged.emit(current)
+
+    def scroll_to_page(self, page_num):
+        """Scroll the view so that a page starts at the top."""
+        if not 0 <= page_num < len(self.page_labels):
+            return
+        self.jumped_page = page_num
+        self.scroll_area.verticalScrollBar().setValue(self.page_labels[page_num].y() - 10)
+        self.schedule_update()
+
+    def update_tiles(self, page_num, label):
+        """Request the tiles of a large page in or near the view and drop the ones far away from it."""
+        page_size = self.page_sizes[page_num]
+        dpi = self.page_dpi(page_num)
+        scale = dpi / 72
+        on_screen = set(tiles_in_rect(page_size, dpi, self.view_rect(label, 0)))
+        wanted = tiles_in_rect(page_size, dpi, self.view_rect(label, self.prefetch_screens))
+        keep = set(tiles_in_rect(page_size, dpi, self.view_rect(label, self.drop_screens)))
+
+        for tile in [tile for tile in label.tiles if tile not in keep]:
+            label.remove_tile(tile)
+        for request, (column, row, job_id) in list(self.requested_tiles.items()):
+            if request[0] == page_num and (column, row) not in keep:
+                self.render_service.cancel(job_id)
+                del self.requested_tiles[request]
+
+        for column, row in wanted:
+            if (column, row) in label.tiles:
+                continue
+            clip = tuple(float(value) for value in tile_clip(page_size, dpi, column, row))
+            rect = QRectF(clip[0] * scale, clip[1] * scale, (clip[2] - clip[0]) * scale, (clip[3] - clip[1]) * scale)
+            pixmap = self.page_cache.get("tiles", tile_key(self.doc_hash, page_num, dpi, column, row))
+            if pixmap is not None:
+                self.show_tile(page_num, column, row, rect, pixmap)
+                continue
+            priority = PRIORITY_VISIBLE if (column, row) in on_screen else PRIORITY_PREFETCH
+            request = self.requested_tiles.get((page_num, float(dpi), clip))
+            # A tile already queued only gets its priority raised, a failed one is submitted again
+            if request is not None and self.render_service.raise_priority(request[2], priority):
+                continue
+            job_id = self.render_service.submit(self.doc_key, page_num, dpi, priority, clip)
+            self.requested_tiles[(page_num, float(dpi), clip)] = (column, row, job_id)
+
+    def on_tile_rendered(self, doc_key, page_num, dpi, clip, image):
+        if doc_key != self.doc_key:
+            return
+        request = self.requested_tiles.pop((page_num, dpi, clip), None)
+        if request is None:
+            return
+        column, row, _ = request
+        pixmap = QPixmap.fromImage(image)
+        self.page_cache.put("tiles", tile_key(self.doc_hash, page_num, dpi, column, row), pixmap)
+        scale = dpi / 72
+        rect = QRectF(clip[0] * scale, clip[1] * scale, (clip[2] - clip[0]) * scale, (clip[3] - clip[1]) * scale)
+        self.show_tile(page_num, column, row, rect, pixmap)
+
+    def show_tile(self, page_num, column, row, rect, pixmap):
+        self.page_labels[page_num].set_tile((column, row), rect, pixmap)
+        self.tiled_pages.add(page_num)
+
+    def on_page_rendered(self, doc_key, page_num, dpi, image):
+        # The same page is also rendered at other DPIs for printing, thumbnails and the print preview
+        request = self.requested.get(page_num)
+        if doc_key != self.doc_key or request is None or request[1] != dpi:
+            return
+        pixmap = QPixmap.fromImage(image)
+        self.page_cache.put("screen", self.cache_key(page_num), pixmap)
+        self.show_page(page_num, pixmap)
+
+    def show_page(self, page_num, pixmap):
+        self.requested.pop(page_num, None)
+        self.page_labels[page_num].setPixmap(pixmap)
+        self.rendered.add(page_num)
+
+    def release_page(self, page_num):
+        request = self.requested.pop(page_num, None)
+        if request is not None:
+            self.render_service.cancel(request[0])
+        if page_num in self.rendered:
+            self.page_labels[page_num].clear()
+            self.rendered.discard(page_num)
+        if page_num in self.tiled_pages:
+            for request, (column, row, job_id) in list(self.requested_tiles.items()):
+                if request[0] == page_num:
+                    self.render_service.cancel(job_id)
+                    del self.requested_tiles[request]
+            self.page_labels[page_num].clear_tiles()
+            self.tiled_pages.discard(page_num)
+
+    def set_zoom(self, zoom):
+        """Resize the page placeholders to `zoom` times their fitted size and render them again."""
+        zoom = min(max(zoom, MIN_ZOOM), MAX_ZOOM)
+        if zoom == self.zoom:
+            return
+
+        # Keep the point in the middle of the view in place
+        scroll_bar = self.scroll_area.verticalScrollBar()
+        content_height = max(self.scroll_area.widget().height(), 1)
+        center = (scroll_bar.value() + self.scroll_area.viewport().height() / 2) / content_height
+
+        for page_num in range(len(self.page_labels)):
+            self.release_page(page_num)
+        # Tiles still queued for pages that never showed one
+        for column, row, job_id in self.requested_tiles.values():
+            self.render_service.cancel(job_id)
+        self.requested_tiles.clear()
+
+        self.zoom = zoom
+        for label, (width, height) in zip(self.page_labels, self.base_sizes):
+            label.setFixedSize(round(width * zoom), round(height * zoom))
+
+        self.scroll_area.widget().layout().activate()
+        content_height = self.scroll_area.widget().height()
+        scroll_bar.setValue(int(center * content_height - self.scroll_area.viewport().height() / 2))
+        self.schedule_update()
+
+    def close(self):
+        """Stop loading pages, called when the tab of the document is closed."""
+        self.update_timer.stop()
+        self.render_service.pageRendered.disconnect(self.on_page_rendered)
+        self.render_service.tileRendered.disconnect(self.on_tile_rendered)
+        for job_id, dpi in self.requested.values():
+            self.render_service.cancel(job_id)
+        self.requested.clear()
+        for column, row, job_id in self.requested_tiles.values():
+            self.render_service.cancel(job_id)
+        self.requested_tiles.clear()
@@ -0,0 +1,390 @@
+"""
+Streaming print path.
+
+Pages are rendered by the render service, painted onto the printer and
+released one at a time. The next page is already rendering in a worker
+process while the current one is painted, so at most `lookahead + 1` pages
+are held in memory whatever the size of the range.
+
+Pages are rendered at the resolution of the printer, up to MAX_PRINT_DPI,
+and only the part of a page that lands on the paper is rendered. When that
+part would not fit in the memory budget at the printer resolution the DPI
+is lowered to fit, down to MIN_PRINT_DPI; a page that would need less, such
+as an A0 or A1 drawing printed on a large sheet, is rendered and painted
+tile by tile at the printer resolution instead (see tileRenderer), and
+tiles that fall outside the printable area are not rendered at all.
+
+In vector mode the pages are converted to SVG in the render workers, with
+text kept as text, and drawn with QSvgRenderer at the resolution of the
+printer instead, with the watermark painted over them. Pages that cannot be
+converted fall back to the raster path. QSvgRenderer only implements SVG
+Tiny 1.2: fonts may be substituted and features it does not support, such
+as some patterns, blend modes and clip paths, are dropped without
+isValid() noticing. Vector mode is therefore opt-in and raster stays the
+default.
+"""
+import logging
+import math
+
+from PyQt5.QtWidgets import QProgressDialog
+from PyQt5.QtGui import QPainter
+from PyQt5.QtCore import Qt, QRect, QRectF, QSize, QObject, QEventLoop, QByteArray
+from PyQt5.QtSvg import QSvgRenderer
+
+import instrumentation
+from renderService import PRIORITY_PRINT
+from tileRenderer import all_tiles, tile_clip, tile_size_for_budget
+from watermark import watermark_brush
+
+
+PRINT_DPI_OPTIONS = [600, 300, 72]  # Pages that fail to render are retried at the next lower DPI
+MAX_PRINT_DPI = 600
+MIN_PRINT_DPI = 300  # Lowest DPI a page is rendered at to fit the budget before it is tiled instead
+PRINT_MEMORY_BUDGET_MB = 256  # Largest raster of a single page or tile
+
+PRINT_MODE_RASTER = "raster"
+PRINT_MODE_VECTOR = "vector"
+PRINT_MODES = (PRINT_MODE_RASTER, PRINT_MODE_VECTOR)
+
+
+def target_rect(printer, pixmap_size):
+    """Where a page of `pixmap_size` printer pixels is drawn on the printer page."""
+    page_rect = printer.pageRect()
+
+    x = (page_rect.x() + (page_rect.width() - pixmap_size.width()) - 200) // 2
+    y = (page_rect.y() + (page_rect.height() - pixmap_size.height())) // 2
+
+    if x >= 0 and x <= 1000 or y >= 0 and y <= 1000:
+        return QRect(-150, -75, pixmap_size.width(), pixmap_size.height())
+    elif x <= -0 and x >= -1000:
+        return QRect(-150, -75, pixmap_size.width(), pixmap_size.height())
+    return QRect(x, y, pixmap_size.width(), pixmap_size.height())
+
+
+def raster_bytes(page_size, dpi):
+    """Memory of an RGB raster of a page of `page_size` points at `dpi`."""
+    return math.ceil(page_size[0] * dpi / 72) * math.ceil(page_size[1] * dpi / 72) * 3
+
+
+def choose_print_dpi(printer, area_size, budget_bytes, max_dpi=MAX_PRINT_DPI, min_dpi=MIN_PRINT_DPI):
+    """
+    DPI to render `area_size` points of a page at, or None if it has to be tiled.
+
+    One rendered pixel per printer pixel, up to `max_dpi`, lowered until the
+    raster fits in `budget_bytes`. None when that would go below `min_dpi`.
+    """
+    dpi = min(printer.resolution(), max_dpi)
+    if raster_bytes(area_size, dpi) <= budget_bytes:
+        return dpi
+    fitted = int(dpi * math.sqrt(budget_bytes / raster_bytes(area_size, dpi)))
+    while fitted > 0 and raster_bytes(area_size, fitted) > budget_bytes:
+        fitted -= 1
+    return fitted if fitted >= min(min_dpi, dpi) else None
+
+
+def vector_page(svg):
+    """Load the SVG of a page, as converted by RenderService.submit_svg, raises ValueError if Qt cannot parse it."""
+    renderer = QSvgRenderer(QByteArray(svg))
+    if not renderer.isValid():
+        raise ValueError("invalid SVG")
+    return renderer
+
+
+class PrintJob(QObject):
+    """
+    Print a range of pages of a ViewerDocument with a cancellable progress dialog.
+
+    The job is a list of pieces, whole pages or tiles of large pages, that
+    are requested, painted and released in order. run() blocks in a local
+    event loop until every piece has been painted, the user cancels or
+    rendering fails for good, and returns True when the job was sent to the
+    printer completely.
+    """
+
+    def __init__(self, render_service, document, printer, page_numbers,
+                 dpi_options=PRINT_DPI_OPTIONS, lookahead=1, mode=PRINT_MODE_RASTER,
+                 watermark_text="QFS COPY", memory_budget_mb=PRINT_MEMORY_BUDGET_MB, parent=None):
+        super().__init__(parent)
+        self.render_service = render_service
+        self.document = document
+        self.printer = printer
+        self.page_numbers = list(page_numbers)
+        self.dpi_options = list(dpi_options)
+        self.lookahead = lookahead
+        self.mode = mode
+        self.watermark_text = watermark_text
+        self.budget_bytes = int(memory_budget_mb * 1024 * 1024)
+
+        self.painter = None
+        self.progress = None
+        self.loop = QEventLoop()
+        self.pieces = []  # (ordinal of the page in the job, page number, clip or None, DPIs to try)
+        self.next_index = 0  # Index in pieces of the next piece to paint
+        self.submitted = 0  # Pieces handed to the render service
+        self.attempt = {}  # piece index -> index in its DPIs of the running attempt
+        self.job_ids = {}  # piece index -> job id of the running attempt
+        self.waiting = {}  # (page number, dpi, clip) or (page number, "svg") -> piece index
+        self.ready = {}  # piece index -> QImage or QSvgRenderer, or None when every attempt failed
+        self.current_page = None  # Ordinal of the page being printed
+        self.pages_printed = 0
+        self.cancelled = False
+        self.pumping = False
+
+    def dpi_options_from(self, dpi):
+        return [dpi] + [option for option in self.dpi_options if option < dpi]
+
+    def visible_clip(self, page_number, printable):
+        """Part of a page that lands on the paper as a clip in points, None for the whole page."""
+        page_rect = QRectF(self.page_rect(page_number))
+        visible = page_rect.intersected(printable)
+        if visible.isEmpty() or visible == page_rect:
+            return None
+        scale = self.printer.resolution() / 72
+        return ((visible.left() - page_rect.left()) / scale, (visible.top() - page_rect.top()) / scale,
+                (visible.right() - page_rect.left()) / scale, (visible.bottom() - page_rect.top()) / scale)
+
+    def plan(self):
+        """Split the job into pieces with their DPIs, pages that cannot fit the memory budget are printed in tiles."""
+        resolution = self.printer.resolution()
+        page_rect = self.printer.pageRect()
+        printable = QRectF(0, 0, page_rect.width(), page_rect.height())
+        dpi = min(resolution, MAX_PRINT_DPI)
+        tile_size = tile_size_for_budget(self.budget_bytes)
+
+        for ordinal, page_number in enumerate(self.page_numbers):
+            page_size = self.document.page_sizes[page_number]
+            if self.mode == PRINT_MODE_VECTOR:
+                self.pieces.append((ordinal, page_number, None, self.dpi_options_from(dpi)))
+                continue
+
+            clip = self.visible_clip(page_number, printable)
+            area_size = page_size if clip is None else (clip[2] - clip[0], clip[3] - clip[1])
+            page_dpi = choose_print_dpi(self.printer, area_size, self.budget_bytes)
+            if page_dpi is not None:
+                if page_dpi < dpi:
+                    logging.info(f"Printing page {page_number+1} at {page_dpi} DPI to fit the memory budget.")
+                self.pieces.append((ordinal, page_number, clip, self.dpi_options_from(page_dpi)))
+                continue
+
+            # Only the tiles that land on the paper are rendered
+            clips = [tile_clip(page_size, dpi, column, row, tile_size) for column, row in all_tiles(page_size, dpi, tile_size)]
+            visible = [clip for clip in clips if self.piece_rect(page_number, clip).intersects(printable)] or clips[:1]
+            logging.info(f"Printing page {page_number+1} in {len(visible)} tiles at {dpi} DPI, "
+                         f"{raster_bytes(page_size, dpi) / (1024 * 1024):.0f} MB as a whole page.")
+            for clip in visible:
+                self.pieces.append((ordinal, page_number, clip, self.dpi_options_from(dpi)))
+        logging.debug("Print resolution %s DPI, rendering at %s DPI.", resolution, dpi)
+
+    def page_rect(self, page_number):
+        """Target rect of a whole page on the printer, in printer pixels."""
+        scale = self.printer.resolution() / 72
+        page_size = self.document.page_sizes[page_number]
+        return target_rect(self.printer, QSize(round(page_size[0] * scale), round(page_size[1] * scale)))
+
+    def piece_rect(self, page_number, clip):
+        rect = QRectF(self.page_rect(page_number))
+        if clip is None:
+            return rect
+        scale = self.printer.resolution() / 72
+        x0, y0, x1, y1 = clip
+        return QRectF(rect.x() + x0 * scale, rect.y() + y0 * scale, (x1 - x0) * scale, (y1 - y0) * scale)
+
+    def run(self):
+        if not self.page_numbers:
+            return True
+
+        self.painter = QPainter(self.printer)
+        if not self.painter.isActive():
+            logging.error("Could not start printing.")
+            return False
+        self.painter.setRenderHint(QPainter.Antialiasing)
+        self.painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        self.plan()
+
+        self.progress = QProgressDialog("Printing...", "Cancel", 0, len(self.pieces), self.parent())
+        self.progress.setWindowTitle("Print")
+        self.progress.setWindowModality(Qt.WindowModal)
+        self.progress.setMinimumDuration(0)
+        self.progress.setValue(0)
+        self.progress.canceled.connect(self.cancel)
+
+        self.render_service.pageRendered.connect(self.on_page_rendered)
+        self.render_service.renderFailed.connect(self.on_render_failed)
+        self.render_service.tileRendered.connect(self.on_tile_rendered)
+        self.render_service.tileFailed.connect(self.on_tile_failed)
+        self.render_service.svgRendered.connect(self.on_svg_rendered)
+        self.render_service.svgFailed.connect(self.on_svg_failed)
+        try:
+            self.pump()
+            if not self.finished():
+                self.loop.exec_()
+        finally:
+            self.render_service.pageRendered.disconnect(self.on_page_rendered)
+            self.render_service.renderFailed.disconnect(self.on_render_failed)
+            self.render_service.tileRendered.disconnect(self.on_tile_rendered)
+            self.render_service.tileFailed.disconnect(self.on_tile_failed)
+            self.render_service.svgRendered.disconnect(self.on_svg_rendered)
+            self.render_service.svgFailed.disconnect(self.on_svg_failed)
+            for job_id in self.job_ids.values():
+                self.render_service.cancel(job_id)
+            self.job_ids.clear()
+            self.ready.clear()
+            self.painter.end()
+            # Closing the dialog emits canceled, the job is over by now
+            self.progress.canceled.disconnect(self.cancel)
+            self.progress.close()
+
+        return not self.cancelled
+
+    def finished(self):
+        return self.cancelled or self.next_index >= len(self.pieces)
+
+    def pump(self):
+        """Paint what is ready and keep the next `lookahead` pieces rendering."""
+        # QProgressDialog.setValue processes events, results arriving meanwhile are picked up by the outer call
+        if self.pumping:
+            return
+        self.pumping = True
+        try:
+            while True:
+                self.fill_window()
+                if not self.paint_ready_pieces():
+                    break
+        finally:
+            self.pumping = False
+        if self.finished():
+            self.loop.quit()
+
+    def fill_window(self):
+        while self.submitted < len(self.pieces) and self.submitted <= self.next_index + self.lookahead:
+            index = self.submitted
+            self.submitted += 1
+            self.attempt[index] = 0
+            if self.mode == PRINT_MODE_VECTOR:
+                self.request_vector(index)
+            else:
+                self.request(index)
+
+    def request_vector(self, index):
+        page_number = self.pieces[index][1]
+        self.waiting[(page_number, "svg")] = index
+        self.job_ids[index] = self.render_service.submit_svg(self.document.doc_key, page_number, PRIORITY_PRINT)
+
+    def request_raster_fallback(self, index, message):
+        _, page_number, _, dpi_options = self.pieces[index]
+        logging.warning(f"Vector output failed for page {page_number+1}, printing it as an image: {message}")
+        # The fallback raster is not split in tiles, keep it within the memory budget
+        page_size = self.document.page_sizes[page_number]
+        within_budget = [dpi for dpi in dpi_options if raster_bytes(page_size, dpi) <= self.budget_bytes]
+        self.pieces[index] = self.pieces[index][:3] + (within_budget or dpi_options[-1:],)
+        self.request(index)
+
+    def request(self, index):
+        _, page_number, clip, dpi_options = self.pieces[index]
+        dpi = dpi_options[self.attempt[index]]
+        self.waiting[(page_number, float(dpi), clip)] = index
+        self.job_ids[index] = self.render_service.submit(self.document.doc_key, page_number, dpi, PRIORITY_PRINT, clip)
+
+    def take_waiting(self, doc_key, request):
+        """Piece index of a result that belongs to this job, or None."""
+        if doc_key != self.document.doc_key:
+            return None
+        index = self.waiting.pop(request, None)
+        if index is not None:
+            del self.job_ids[index]
+        return index
+
+    def on_page_rendered(self, doc_key, page_number, dpi, image):
+        self.on_tile_rendered(doc_key, page_number, dpi, None, image)
+
+    def on_render_failed(self, doc_key, page_number, dpi, message):
+        self.on_tile_failed(doc_key, page_number, dpi, None, message)
+
+    def on_tile_rendered(self, doc_key, page_number, dpi, clip, image):
+        index = self.take_waiting(doc_key, (page_number, float(dpi), clip))
+        if index is None:
+            return
+        self.ready[index] = image
+        self.pump()
+
+    def on_tile_failed(self, doc_key, page_number, dpi, clip, message):
+        index = self.take_waiting(doc_key, (page_number, float(dpi), clip))
+        if index is None:
+            return
+        self.attempt[index] += 1
+        if self.attempt[index] < len(self.pieces[index][3]):
+            self.request(index)
+        elif clip is None:
+            logging.error(f"All rendering attempts failed for page {page_number+1}. Skipping this page.")
+            self.ready[index] = None
+        else:
+            logging.error(f"All rendering attempts failed for a tile of page {page_number+1}. Leaving it blank.")
+            self.ready[index] = None
+        self.pump()
+
+    def on_svg_rendered(self, doc_key, page_number, svg):
+        index = self.take_waiting(doc_key, (page_number, "svg"))
+        if index is None:
+            return
+        try:
+            self.ready[index] = vector_page(svg)
+        except ValueError as e:
+            self.request_raster_fallback(index, str(e))
+        self.pump()
+
+    def on_svg_failed(self, doc_key, page_number, message):
+        index = self.take_waiting(doc_key, (page_number, "svg"))
+        if index is None:
+            return
+        self.request_raster_fallback(index, message)
+        self.pump()
+
+    def paint_ready_pieces(self):
+        """Paint the pieces that are ready, in order, and release them. Returns True if any piece was done."""
+        done = False
+        while not self.cancelled and self.next_index < len(self.pieces):
+            if self.next_index not in self.ready:
+                break
+            ordinal, page_number, clip, _ = self.pieces[self.next_index]
+            page_image = self.ready.pop(self.next_index)
+
+            # A page that failed completely is skipped, a failed tile leaves a gap on its page
+            if page_image is not None or clip is not None:
+                if self.current_page != ordinal:
+                    if self.pages_printed > 0:
+                        self.printer.newPage()
+                    self.current_page = ordinal
+                    self.pages_printed += 1
+                with instrumentation.span("print paint"):
+                    if isinstance(page_image, QSvgRenderer):
+                        self.paint_vector_page(page_number, page_image)
+                    elif page_image is not None:
+                        self.painter.drawImage(self.piece_rect(page_number, clip), page_image)
+                instrumentation.count("print paint", "pages" if clip is None else "tiles")
+            del page_image
+
+            self.next_index += 1
+            done = True
+            self.progress.setLabelText(f"Printing page {ordinal + 1} of {len(self.page_numbers)}...")
+            self.progress.setValue(self.next_index)
+        return done
+
+    def paint_vector_page(self, page_number, renderer):
+        # Same placement as a raster page rendered at the printer resolution
+        rect = self.page_rect(page_number)
+        renderer.render(self.painter, QRectF(rect))
+
+        # The watermark is otherwise only part of the on-screen container
+        self.painter.save()
+        self.painter.setClipRect(rect)
+        self.painter.fillRect(rect, watermark_brush(self.watermark_text, self.printer.resolution() / 96))
+        self.painter.restore()
+
+    def cancel(self):
+        if self.cancelled:
+            return
+        self.cancelled = True
+        logging.info("Print job cancelled.")
+        self.printer.abort()
+        self.loop.quit()
+
@@ -0,0 +1,152 @@
+"""
+Print preview fed from cached, preview-resolution pages.
+
+QPrintPreviewDialog asks for the whole document again through paintRequested
+whenever the zoom, the page setup or the window size changes. Painting the
+pages from scratch every time makes the dialog unusable for long documents,
+so PrintPreview only paints what it already has: pages rendered for the
+current page setup are kept as QPixmaps in the "preview" tier of the page
+cache, and pages that are not rendered yet are painted as placeholders.
+
+Only the pages around the page shown in the preview are requested from the
+render service. When they arrive the preview is refreshed once per burst.
+"""
+import logging
+
+from PyQt5.QtGui import QPainter, QPixmap, QColor
+from PyQt5.QtCore import Qt, QObject, QTimer
+from PyQt5.QtPrintSupport import QPrinter, QPrintPreviewWidget
+
+from pageCache import page_key
+from renderService import PRIORITY_VISIBLE
+
+
+PREVIEW_SCREEN_DPI = 96  # Resolution of a preview page filling the paper at 100% zoom
+PREVIEW_PREFETCH_PAGES = 2  # Pages requested before and after the page shown
+
+
+def preview_dpi(printer, page_size):
+    """DPI at which a page of `page_size` points fills the paper of `printer` at PREVIEW_SCREEN_DPI."""
+    paper = printer.pageRect(QPrinter.Inch)
+    if paper.width() <= 0 or paper.height() <= 0:
+        return PREVIEW_SCREEN_DPI
+    scale = min(paper.width() * 72 / page_size[0], paper.height() * 72 / page_size[1])
+    # Rounded so small differences between page setups share their renders
+    return round(PREVIEW_SCREEN_DPI * scale, 1)
+
+
+class PrintPreview(QObject):
+    """Paint a ViewerDocument into a QPrintPreviewDialog from the preview cache."""
+
+    def __init__(self, render_service, page_cache, document, dialog, prefetch_pages=PREVIEW_PREFETCH_PAGES):
+        super().__init__(dialog)
+        self.render_service = render_service
+        self.page_cache = page_cache
+        self.document = document
+        self.prefetch_pages = prefetch_pages
+        self.printer = None
+        self.dpis = []  # Preview DPI of every page for the page setup last painted
+        self.requested = {}  # page number -> (render job id, dpi)
+
+        self.preview_widget = dialog.findChild(QPrintPreviewWidget)
+        if self.preview_widget is not None:
+            # Also emitted when the page shown in the preview changes
+            self.preview_widget.previewChanged.connect(self.request_visible_pages)
+
+        # Coalesce the pages arriving one after another into one refresh
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(50)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+        render_service.pageRendered.connect(self.on_page_rendered)
+        render_service.renderFailed.connect(self.on_render_failed)
+        dialog.finished.connect(self.close)
+
+    def cache_key(self, page_number, dpi):
+        return page_key(self.document.doc_hash, page_number, dpi=dpi)
+
+    def paint(self, printer):
+        """Slot for paintRequested: draw the cached pages and a placeholder for the others."""
+        self.printer = printer
+        self.dpis = [preview_dpi(printer, page_size) for page_size in self.document.page_sizes]
+
+        painter = QPainter(printer)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        page_area = painter.viewport()
+        for page_number in range(self.document.page_count):
+            if page_number > 0:
+                printer.newPage()
+            pixmap = self.page_cache.get("preview", self.cache_key(page_number, self.dpis[page_number]))
+            if pixmap is None:
+                self.paint_placeholder(painter, page_area, page_number)
+                continue
+            size = pixmap.size()
+            size.scale(page_area.size(), Qt.KeepAspectRatio)
+            painter.setViewport(page_area.x(), page_area.y(), size.width(), size.height())
+            painter.setWindow(pixmap.rect())
+            painter.drawPixmap(0, 0, pixmap)
+            painter.setViewport(page_area)
+            painter.setWindow(page_area)
+        painter.end()
+
+        # Nothing is shown the first time, ask for the first pages right away
+        self.request_visible_pages()
+
+    def paint_placeholder(self, painter, page_area, page_number):
+        painter.setPen(QColor(160, 160, 160))
+        painter.drawText(page_area, Qt.AlignCenter, f"Loading page {page_number + 1}...")
+
+    def visible_range(self):
+        """(first, last) page numbers to have rendered, around the page shown in the preview."""
+        current = self.preview_widget.currentPage() - 1 if self.preview_widget is not None else 0
+        current = max(0, min(current, self.document.page_count - 1))
+        return (max(0, current - self.prefetch_pages),
+                min(self.document.page_count - 1, current + self.prefetch_pages))
+
+    def request_visible_pages(self):
+        if self.printer is None or not self.dpis:
+            return
+        first, last = self.visible_range()
+        for page_number in range(first, last + 1):
+            dpi = self.dpis[page_number]
+            if page_number in self.requested or self.page_cache.get("preview", self.cache_key(page_number, dpi)) is not None:
+                continue
+            job_id = self.render_service.submit(self.document.doc_key, page_number, dpi, PRIORITY_VISIBLE)
+            self.requested[page_number] = (job_id, float(dpi))
+
+        # Pages the preview moved away from are not needed any more
+        for page_number in [page_number for page_number in self.requested if not first <= page_number <= last]:
+            self.render_service.cancel(self.requested.pop(page_number)[0])
+
+    def take_request(self, doc_key, page_number, dpi):
+        if doc_key != self.document.doc_key:
+            return False
+        request = self.requested.get(page_number)
+        if request is None or request[1] != dpi:
+            return False
+        del self.requested[page_number]
+        return True
+
+    def on_page_rendered(self, doc_key, page_number, dpi, image):
+        if not self.take_request(doc_key, page_number, dpi):
+            return
+        self.page_cache.put("preview", self.cache_key(page_number, dpi), QPixmap.fromImage(image))
+        self.refresh_timer.start()
+
+    def on_render_failed(self, doc_key, page_number, dpi, message):
+        if self.take_request(doc_key, page_number, dpi):
+            logging.error(f"Preview of page {page_number+1} failed: {message}")
+
+    def refresh(self):
+        if self.preview_widget is not None:
+            self.preview_widget.updatePreview()
+
+    def close(self, *args):
+        """Stop requesting pages once the dialog is closed, the rendered pages stay cached."""
+        self.refresh_timer.stop()
+        self.render_service.pageRendered.disconnect(self.on_page_rendered)
+        self.render_service.renderFailed.disconnect(self.on_render_failed)
+        for job_id, dpi in self.requested.values():
+            self.render_service.cancel(job_id)
+        self.requested.clear()
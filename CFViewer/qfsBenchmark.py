@@ -0,0 +1,572 @@
+"""
+Benchmarks for the QFS viewer and converter.
+
+    python qfsBenchmark.py codecs FILE.pdf [FILE.pdf ...] [--json results.json]
+
+codecs: compares file size, write time and payload decode time of the
+original JSON layout against the binary container with every available
+payload codec.
+
+    python qfsBenchmark.py repaint [--height 40000] [--frames 300] [--json results.json]
+
+repaint: scrolls a watermarked container of the given height offscreen and
+reports the frame time of the tile cached watermark against the previous
+paint path that drew a new tile over the whole widget on every repaint.
+
+    python qfsBenchmark.py suite [--pages 1 10 100] [--papers a4 a0] [--kinds text image]
+                                 [--until print] [--json results.json]
+
+suite: generates synthetic PDFs with PyMuPDF for every combination of page
+count, paper size and content kind, then runs the hot paths of the
+converter and the viewer on each one: convert (convert_to_custom_format),
+open (open_viewer_window, display_pdf and the time until the first page is
+shown), render (every page at 72 DPI through the render service) and print
+(PrintJob to a PDF file through QPrinter). --until stops after an earlier
+stage. Each document runs in its own process under QT_QPA_PLATFORM=offscreen,
+so the peak RSS of a case is not inflated by the ones before it. Wall time,
+peak RSS and bytes written are recorded for every stage, along with the
+instrumentation spans of the case (see instrumentation.py). The documents are
+generated from a fixed seed, so runs on different machines or commits can
+be compared file by file.
+
+    python qfsBenchmark.py multi-open [--files 20] [--pages 10] [--json results.json]
+
+multi-open: converts `--files` synthetic documents, then opens all of them
+at once in an offscreen viewer, one file after the other on the GUI thread
+and in parallel through the document loader. Reports the time until the
+first tab shows its first page and until every tab is filled in.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import instrumentation
+import qfsFormat
+
+try:
+    import resource
+except ImportError:  # Windows, peak RSS is not reported there
+    resource = None
+
+
+SUITE_STAGES = ("convert", "open", "render", "print")
+SUITE_PAPERS = ("a4", "a3", "a2", "a1", "a0")
+SUITE_KINDS = ("text", "image")
+SUITE_RESULT_PREFIX = "SUITE-RESULT "
+VIEWER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Custom File Viewer.py")
+WORDS = ("quality", "inspection", "drawing", "revision", "approved", "material", "tolerance", "assembly",
+         "section", "detail", "surface", "finish", "weld", "bolt", "flange", "nominal", "scale", "sheet")
+
+
+def _best_of(repeat, function):
+    """Run `function` `repeat` times and return the fastest wall time in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def codec_variants():
+    """(name, writer) pairs for every layout and codec that can be written here."""
+    variants = [("json+base64", lambda path, source: qfsFormat.write_legacy_qfs(path, {}, source))]
+    codecs = [codec for codec in qfsFormat.CODECS if codec != "zstd" or qfsFormat.zstandard is not None]
+    for codec in codecs:
+        levels = [None] if codec == "none" else sorted({1, qfsFormat.DEFAULT_LEVELS[codec], 9 if codec == "deflate" else 19})
+        for level in levels:
+            name = "v2 " + codec if level is None else f"v2 {codec} -{level}"
+            variants.append((name, lambda path, source, codec=codec, level=level:
+                             qfsFormat.write_qfs(path, {}, source, codec=codec, level=level)))
+    return variants
+
+
+def benchmark_codecs(paths, repeat=3):
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        output_path = os.path.join(folder, "benchmark.QFS")
+        for path in paths:
+            source_size = os.path.getsize(path)
+            for name, writer in codec_variants():
+                def write():
+                    with open(path, "rb") as source:
+                        writer(output_path, source)
+
+                def decode():
+                    with qfsFormat.QFSReader(output_path) as reader:
+                        for _ in reader.iter_payload():
+                            pass
+
+                write_seconds = _best_of(repeat, write)
+                decode_seconds = _best_of(repeat, decode)
+                results.append({
+                    "file": path,
+                    "variant": name,
+                    "source_bytes": source_size,
+                    "qfs_bytes": os.path.getsize(output_path),
+                    "size_ratio": os.path.getsize(output_path) / source_size if source_size else 0,
+                    "write_seconds": write_seconds,
+                    "decode_seconds": decode_seconds,
+                })
+    return results
+
+
+def print_codec_table(results):
+    print(f"{'file':30} {'variant':16} {'size':>10} {'ratio':>6} {'write ms':>9} {'decode ms':>10}")
+    for row in results:
+        print(f"{os.path.basename(row['file'])[:30]:30} {row['variant']:16} {row['qfs_bytes'] / 1e6:9.2f}M "
+              f"{row['size_ratio']:6.2f} {row['write_seconds'] * 1000:9.1f} {row['decode_seconds'] * 1000:10.1f}")
+
+
+def benchmark_repaint(height=40000, frames=300, step=120):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication, QScrollArea
+    from PyQt5.QtGui import QPainter, QBrush
+
+    import watermark
+
+    class UncachedWatermarkedWidget(watermark.WatermarkedWidget):
+        """The paint path before the tile cache: new tile, whole widget, every repaint."""
+
+        def paintEvent(self, event):
+            painter = QPainter(self)
+            painter.fillRect(self.rect(), QBrush(watermark.generate_watermark_pixmap(self.watermark_text)))
+            painter.end()
+
+    app = QApplication.instance() or QApplication([])
+    results = []
+    for name, widget_class in (("uncached", UncachedWatermarkedWidget), ("cached tile", watermark.WatermarkedWidget)):
+        watermark.clear_watermark_cache()
+        scroll_area = QScrollArea()
+        scroll_area.resize(1000, 800)
+        container = widget_class(watermark_text="QFS COPY")
+        container.setFixedSize(980, height)
+        scroll_area.setWidget(container)
+        scroll_area.show()
+        app.processEvents()
+
+        scroll_bar = scroll_area.verticalScrollBar()
+        frame_times = []
+        for frame in range(frames):
+            scroll_bar.setValue((frame * step) % max(scroll_bar.maximum(), 1))
+            start = time.perf_counter()
+            scroll_area.viewport().repaint()
+            frame_times.append(time.perf_counter() - start)
+        scroll_area.close()
+        scroll_area.deleteLater()
+        app.processEvents()
+
+        frame_times.sort()
+        results.append({
+            "variant": name,
+            "height": height,
+            "frames": frames,
+            "mean_ms": sum(frame_times) / len(frame_times) * 1000,
+            "p50_ms": frame_times[len(frame_times) // 2] * 1000,
+            "p95_ms": frame_times[int(len(frame_times) * 0.95)] * 1000,
+        })
+    return results
+
+
+def print_repaint_table(results):
+    print(f"{'variant':16} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for row in results:
+        print(f"{row['variant']:16} {row['mean_ms']:9.2f} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f}")
+
+
+def peak_rss_mb(who="self"):
+    """Peak resident set size of this process, or of its finished children, in MB. None where unknown."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def environment_info():
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "zstd": qfsFormat.zstandard is not None,
+    }
+    try:
+        import fitz
+        info["pymupdf"] = fitz.VersionBind
+    except ImportError:
+        pass
+    try:
+        from PyQt5.QtCore import PYQT_VERSION_STR, QT_VERSION_STR
+        info["pyqt"] = PYQT_VERSION_STR
+        info["qt"] = QT_VERSION_STR
+    except ImportError:
+        pass
+    return info
+
+
+def make_synthetic_pdf(path, pages, paper="a4", kind="text", seed=0):
+    """
+    Write a PDF of `pages` pages of `paper` size, text-heavy or image-heavy.
+
+    The content only depends on the arguments, so the same document is
+    generated on every run.
+    """
+    import fitz
+
+    rng = random.Random(f"{seed}-{pages}-{paper}-{kind}")
+    width, height = fitz.paper_size(paper)
+    scale = width / fitz.paper_size("a4")[0]
+    document = fitz.open()
+    for page_number in range(pages):
+        page = document.new_page(width=width, height=height)
+        body = fitz.Rect(36 * scale, 48 * scale, width - 36 * scale, height - 36 * scale)
+        if kind == "text":
+            word_count = int(body.width * body.height / (40 * scale * scale))
+            text = " ".join(rng.choice(WORDS) for _ in range(word_count))
+            page.insert_textbox(body, text, fontsize=9 * scale)
+        else:
+            # Noise does not compress, the worst case for the payload and the renderer
+            edge = min(2048, int(512 * scale))
+            pixmap = fitz.Pixmap(fitz.csRGB, edge, edge, rng.randbytes(edge * edge * 3), 0)
+            page.insert_image(body, pixmap=pixmap)
+        page.insert_text((36 * scale, 30 * scale), f"Page {page_number + 1} of {pages}", fontsize=12 * scale)
+    document.save(path, deflate=True)
+    document.close()
+
+
+def load_viewer_module():
+    """Import Custom File Viewer.py, whose name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location("custom_file_viewer", VIEWER_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _process_events_until(app, condition, timeout=300):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("timed out waiting for the viewer")
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def run_suite_case(pdf_path, work_dir, until="print", print_dpi=600, print_mode="raster"):
+    """Run the stages up to `until` on one PDF in this process, returns a list of stage results."""
+    stages = SUITE_STAGES[:SUITE_STAGES.index(until) + 1]
+    name = os.path.splitext(os.path.basename(pdf_path))[0]
+    qfs_path = os.path.join(work_dir, name + ".QFS")
+    results = []
+
+    def record(stage, seconds, bytes_written=0, **extra):
+        results.append(dict({"stage": stage, "seconds": seconds, "peak_rss_mb": peak_rss_mb(),
+                             "bytes_written": bytes_written}, **extra))
+
+    import brandNewExtension
+    start = time.perf_counter()
+    brandNewExtension.convert_to_custom_format(pdf_path, qfs_path)
+    record("convert", time.perf_counter() - start, os.path.getsize(qfs_path))
+    if stages == ("convert",):
+        return results
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    viewer_module = load_viewer_module()
+    viewer = viewer_module.CustomFileViewer()
+    viewer.show()
+    app.processEvents()
+    try:
+        display_seconds = []
+        display_pdf = viewer.display_pdf
+
+        def timed_display_pdf(*args):
+            display_start = time.perf_counter()
+            display_pdf(*args)
+            display_seconds.append(time.perf_counter() - display_start)
+
+        viewer.display_pdf = timed_display_pdf
+        start = time.perf_counter()
+        viewer.open_viewer_window(qfs_path)
+        open_seconds = time.perf_counter() - start
+        tab = viewer.tab_widget.widget(viewer.tab_widget.count() - 1)
+        document = viewer.documents.get(tab)
+        if document is None or document.loader is None:
+            raise RuntimeError("the viewer could not open the converted file")
+        viewer.tab_widget.setCurrentWidget(tab)
+        loader = document.loader
+        _process_events_until(app, lambda: loader.rendered or loader.tiled_pages)
+        record("open", open_seconds, display_pdf_seconds=sum(display_seconds),
+               first_page_seconds=time.perf_counter() - start, pages=document.page_count)
+        if "render" not in stages:
+            return results
+
+        # Rendered in batches that keep every worker busy, holding all pages at once runs out of memory on large documents
+        batch_size = 2 * viewer.render_service.worker_count
+        rendered_pages = 0
+        start = time.perf_counter()
+        for first in range(0, document.page_count, batch_size):
+            batch = range(first, min(first + batch_size, document.page_count))
+            rendered_pages += len(viewer.render_service.render_pages(document.doc_key, batch, 72))
+        seconds = time.perf_counter() - start
+        record("render", seconds, pages=rendered_pages, pages_per_second=rendered_pages / seconds if seconds else 0)
+        if "print" not in stages:
+            return results
+
+        from PyQt5.QtPrintSupport import QPrinter
+        from printPipeline import PrintJob
+
+        output_pdf = os.path.join(work_dir, name + "-printed.pdf")
+        printer = QPrinter(QPrinter.HighResolution)
+        printer.setResolution(print_dpi)
+        printer.setPageMargins(0, 0, 30, 0, QPrinter.Millimeter)  # Same as Print in the viewer
+        printer.setOutputFormat(QPrinter.PdfFormat)
+        printer.setOutputFileName(output_pdf)
+        start = time.perf_counter()
+        print_job = PrintJob(viewer.render_service, document, printer, range(document.page_count),
+                             mode=print_mode, parent=viewer)
+        completed = print_job.run()
+        seconds = time.perf_counter() - start
+        print_job.deleteLater()
+        record("print", seconds, os.path.getsize(output_pdf) if os.path.exists(output_pdf) else 0,
+               completed=completed, dpi=print_dpi, mode=print_mode)
+        return results
+    finally:
+        # Stops the render workers, their peak RSS is reported by the caller
+        viewer.close()
+        app.processEvents()
+
+
+def _case_environment(work_dir):
+    return dict(os.environ, QT_QPA_PLATFORM="offscreen",
+                # Keeps the recent files of the viewer out of the user's profile
+                APPDATA=work_dir)
+
+
+def _run_case_process(arguments, environment, timeout):
+    """Run this script with `arguments` in a new process and return the result it printed, or {"error": ...}."""
+    command = [sys.executable, os.path.abspath(__file__)] + arguments
+    try:
+        completed = subprocess.run(command, env=environment, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"error": f"timed out after {timeout} s"}
+    lines = [line for line in completed.stdout.splitlines() if line.startswith(SUITE_RESULT_PREFIX)]
+    if lines:
+        return json.loads(lines[-1][len(SUITE_RESULT_PREFIX):])
+    # The last line of a traceback names the exception
+    error_lines = completed.stderr.strip().splitlines()
+    return {"error": error_lines[-1] if error_lines else f"exit code {completed.returncode}"}
+
+
+def benchmark_suite(page_counts, papers, kinds, until="print", print_dpi=600, print_mode="raster",
+                    seed=0, timeout=3600, work_dir=None):
+    """Run every case in its own offscreen process and collect the stage results."""
+    results = []
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        work_dir = work_dir or temporary_dir
+        os.makedirs(work_dir, exist_ok=True)
+        environment = _case_environment(work_dir)
+        for pages in page_counts:
+            for paper in papers:
+                for kind in kinds:
+                    pdf_path = os.path.join(work_dir, f"synthetic-{pages}p-{paper}-{kind}.pdf")
+                    if not os.path.exists(pdf_path):
+                        make_synthetic_pdf(pdf_path, pages, paper, kind, seed)
+                    case = {"pages": pages, "paper": paper, "kind": kind, "pdf_bytes": os.path.getsize(pdf_path)}
+                    case.update(_run_case_process(["suite-case", pdf_path, "--work-dir", work_dir, "--until", until,
+                                                   "--print-dpi", str(print_dpi), "--print-mode", print_mode],
+                                                  environment, timeout))
+                    results.append(case)
+                    print(f"{pages:5}p {paper:3} {kind:5} " + (case.get("error") or "done"), file=sys.stderr)
+    return results
+
+
+def run_multi_open_case(qfs_paths, mode="parallel"):
+    """
+    Open all `qfs_paths` at once in a new viewer, as from a multi-file selection or drop.
+
+    "parallel" goes through open_files and the document loader, "sequential"
+    calls open_viewer_window for one file after the other on the GUI thread,
+    the path taken before the loader. Returns when every tab is filled in and
+    the first tab shows its first page.
+    """
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    viewer_module = load_viewer_module()
+    viewer = viewer_module.CustomFileViewer()
+    viewer.show()
+    app.processEvents()
+    try:
+        ready_seconds = []
+        start = time.perf_counter()
+        if mode == "parallel":
+            first_tab = viewer.tab_widget.count()
+            viewer.open_files(qfs_paths)
+            viewer.tab_widget.setCurrentIndex(first_tab)
+            while viewer.loading_tabs:
+                opened = len(viewer.documents)
+                _process_events_until(app, lambda: len(viewer.documents) > opened or not viewer.loading_tabs)
+                ready_seconds.extend([time.perf_counter() - start] * (len(viewer.documents) - opened))
+        else:
+            for index, qfs_path in enumerate(qfs_paths):
+                viewer.open_viewer_window(qfs_path)
+                if index == 0:
+                    viewer.tab_widget.setCurrentIndex(viewer.tab_widget.count() - 1)
+                ready_seconds.append(time.perf_counter() - start)
+        if len(viewer.documents) < len(qfs_paths):
+            raise RuntimeError(f"only {len(viewer.documents)} of {len(qfs_paths)} files opened")
+
+        document = viewer.current_document()
+        _process_events_until(app, lambda: document.loader.rendered or document.loader.tiled_pages)
+        return {
+            "mode": mode,
+            "files": len(qfs_paths),
+            "first_page_seconds": time.perf_counter() - start,
+            "all_ready_seconds": ready_seconds[-1],
+            "ready_seconds": ready_seconds,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        viewer.close()
+        app.processEvents()
+
+
+def benchmark_multi_open(files=20, pages=10, paper="a4", kind="text", timeout=3600, work_dir=None):
+    """Time to first page and to all tabs filled in for `files` documents opened at once, sequential and parallel."""
+    import brandNewExtension
+
+    results = []
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        work_dir = work_dir or temporary_dir
+        os.makedirs(work_dir, exist_ok=True)
+        qfs_paths = []
+        for index in range(files):
+            # Different seeds, so no file reuses the cached pages of another
+            pdf_path = os.path.join(work_dir, f"multi-{index:02}-{pages}p-{paper}-{kind}.pdf")
+            qfs_path = os.path.splitext(pdf_path)[0] + ".QFS"
+            if not os.path.exists(qfs_path):
+                make_synthetic_pdf(pdf_path, pages, paper, kind, seed=index)
+                brandNewExtension.convert_to_custom_format(pdf_path, qfs_path)
+            qfs_paths.append(qfs_path)
+
+        environment = _case_environment(work_dir)
+        for mode in ("sequential", "parallel"):
+            case = {"mode": mode, "files": files, "pages": pages, "paper": paper, "kind": kind}
+            case.update(_run_case_process(["multi-open-case", "--mode", mode] + qfs_paths, environment, timeout))
+            results.append(case)
+            print(f"{mode:10} " + (case.get("error") or "done"), file=sys.stderr)
+    return results
+
+
+def print_multi_open_table(results):
+    print(f"{'mode':12} {'files':>5} {'first page s':>13} {'all ready s':>12}")
+    for row in results:
+        if row.get("error"):
+            print(f"{row['mode']:12} error: {row['error']}")
+            continue
+        print(f"{row['mode']:12} {row['files']:5} {row['first_page_seconds']:13.3f} {row['all_ready_seconds']:12.3f}")
+
+
+def print_suite_table(results):
+    print(f"{'case':20} {'stage':8} {'seconds':>9} {'peak RSS MB':>12} {'written MB':>11}")
+    for case in results:
+        name = f"{case['pages']}p {case['paper']} {case['kind']}"
+        if case.get("error"):
+            print(f"{name:20} error: {case['error']}")
+            continue
+        for stage in case["stages"]:
+            rss = f"{stage['peak_rss_mb']:12.1f}" if stage["peak_rss_mb"] is not None else f"{'-':>12}"
+            print(f"{name:20} {stage['stage']:8} {stage['seconds']:9.3f} {rss} {stage['bytes_written'] / 1e6:11.2f}")
+        if case.get("worker_peak_rss_mb") is not None:
+            print(f"{name:20} {'workers':8} {'':9} {case['worker_peak_rss_mb']:12.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    codecs_parser = subparsers.add_parser("codecs", help="compare payload layouts and codecs")
+    codecs_parser.add_argument("files", nargs="+", help="PDF files to store")
+    codecs_parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the fastest is kept")
+    codecs_parser.add_argument("--json", help="also write the results to this JSON file")
+
+    repaint_parser = subparsers.add_parser("repaint", help="scroll frame time of the watermarked container")
+    repaint_parser.add_argument("--height", type=int, default=40000, help="container height in pixels")
+    repaint_parser.add_argument("--frames", type=int, default=300, help="scroll steps to measure")
+    repaint_parser.add_argument("--json", help="also write the results to this JSON file")
+
+    suite_parser = subparsers.add_parser("suite", help="convert, open, render and print synthetic documents")
+    suite_parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100], help="page counts, up to 1000")
+    suite_parser.add_argument("--papers", nargs="+", choices=SUITE_PAPERS, default=["a4", "a0"], help="paper sizes")
+    suite_parser.add_argument("--kinds", nargs="+", choices=SUITE_KINDS, default=list(SUITE_KINDS), help="content kinds")
+    suite_parser.add_argument("--until", choices=SUITE_STAGES, default="print", help="last stage to run")
+    suite_parser.add_argument("--print-dpi", type=int, default=600, help="printer resolution of the print stage")
+    suite_parser.add_argument("--print-mode", choices=("raster", "vector"), default="raster", help="print mode")
+    suite_parser.add_argument("--seed", type=int, default=0, help="seed of the generated documents")
+    suite_parser.add_argument("--timeout", type=int, default=3600, help="seconds allowed per document")
+    suite_parser.add_argument("--work-dir", help="keep the generated and written files in this folder")
+    suite_parser.add_argument("--json", help="also write the results to this JSON file")
+
+    # Runs one document of the suite, started by the suite command in a new process
+    case_parser = subparsers.add_parser("suite-case")
+    case_parser.add_argument("pdf")
+    case_parser.add_argument("--work-dir", required=True)
+    case_parser.add_argument("--until", choices=SUITE_STAGES, default="print")
+    case_parser.add_argument("--print-dpi", type=int, default=600)
+    case_parser.add_argument("--print-mode", choices=("raster", "vector"), default="raster")
+
+    multi_parser = subparsers.add_parser("multi-open", help="open many files at once, sequential against parallel")
+    multi_parser.add_argument("--files", type=int, default=20, help="number of files opened together")
+    multi_parser.add_argument("--pages", type=int, default=10, help="pages per file")
+    multi_parser.add_argument("--paper", choices=SUITE_PAPERS, default="a4", help="paper size")
+    multi_parser.add_argument("--kind", choices=SUITE_KINDS, default="text", help="content kind")
+    multi_parser.add_argument("--timeout", type=int, default=3600, help="seconds allowed per mode")
+    multi_parser.add_argument("--work-dir", help="keep the generated files in this folder")
+    multi_parser.add_argument("--json", help="also write the results to this JSON file")
+
+    # Opens the files of multi-open in one mode, started by the multi-open command in a new process
+    multi_case_parser = subparsers.add_parser("multi-open-case")
+    multi_case_parser.add_argument("files", nargs="+")
+    multi_case_parser.add_argument("--mode", choices=("sequential", "parallel"), default="parallel")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "suite-case":
+        instrumentation.enable()
+        stages = run_suite_case(args.pdf, args.work_dir, args.until, args.print_dpi, args.print_mode)
+        print(SUITE_RESULT_PREFIX + json.dumps({"stages": stages, "worker_peak_rss_mb": peak_rss_mb("children"),
+                                                "spans": instrumentation.snapshot()}))
+        return
+
+    if args.command == "multi-open-case":
+        print(SUITE_RESULT_PREFIX + json.dumps(run_multi_open_case(args.files, args.mode)))
+        return
+
+    if args.command == "codecs":
+        results = benchmark_codecs(args.files, args.repeat)
+        print_codec_table(results)
+    elif args.command == "repaint":
+        results = benchmark_repaint(args.height, args.frames)
+        print_repaint_table(results)
+    elif args.command == "suite":
+        results = benchmark_suite(args.pages, args.papers, args.kinds, args.until, args.print_dpi, args.print_mode,
+                                  args.seed, args.timeout, args.work_dir)
+        print_suite_table(results)
+    elif args.command == "multi-open":
+        results = benchmark_multi_open(args.files, args.pages, args.paper, args.kind, args.timeout, args.work_dir)
+        print_multi_open_table(results)
+
+    if args.json:
+        with open(args.json, "w") as output_file:
+            json.dump({"command": args.command, "environment": environment_info(), "results": results}, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
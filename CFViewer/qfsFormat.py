@@ -0,0 +1,736 @@
+"""
+Reading and writing of QFS files.
+
+Version 2 is a binary container (integers are little endian):
+
+    magic       8 bytes    b"\\x89QFS\\r\\n\\x1a\\n"
+    version     uint16     2
+    flags       uint16     reserved, always 0
+    chunks      repeated until the end of the file
+        tag     4 bytes    ASCII chunk name
+        length  uint64     size of the chunk data in bytes
+        data    length bytes
+
+Known chunks:
+    META    UTF-8 JSON object, the same fields as "metadata" in the old layout
+    PIDX    optional page index, UTF-8 JSON {"page_count": n, "pages":
+            [[width, height, rotation], ...]} with the mediabox size in
+            points and the rotation of every page
+    THMB    optional thumbnails: uint32 length of a UTF-8 JSON directory
+            {"format": "png", "size": max edge in pixels, "entries":
+            [[offset, length], ...]}, followed by the images, offsets are
+            relative to the end of the directory
+    DATA    the original document, raw or compressed as named by the
+            "codec" metadata field ("none", "deflate" or "zstd"); compressed
+            payloads also record their "uncompressed_size"
+    CREF    instead of DATA in chunk store mode: UTF-8 JSON {"chunks":
+            [[sha256, size], ...]} listing the chunks of the document in a
+            shared chunkStore.ChunkStore; the metadata then has "storage":
+            "chunks", "payload_size" and the "payload_sha256" checked when
+            the payload is read
+
+Unknown chunks are skipped, so files written by newer converters still open.
+Files that start with "{" use the original JSON layout described in
+metadatafileformat.json ({"metadata": {...}, "content": "BASE64"}). They are
+still read, and can still be written, with the base64 content streamed in
+blocks so memory use does not grow with the payload.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import struct
+import zlib
+
+import instrumentation
+
+try:
+    import zstandard  # Optional, only needed for the "zstd" codec
+except ImportError:
+    zstandard = None
+
+
+MAGIC = b"\x89QFS\r\n\x1a\n"
+FORMAT_VERSION = 2
+LEGACY_VERSION = 1
+
+# Size of the blocks used when copying payloads in and out of a container
+CHUNK_SIZE = 1024 * 1024
+# Input block of the streaming base64 encoder, a multiple of 3 bytes
+BASE64_BLOCK_SIZE = 3 * 256 * 1024
+
+# Payload compression, change DEFAULT_CODEC to compress new conversions by default
+CODECS = ("none", "deflate", "zstd")
+DEFAULT_CODEC = "none"
+DEFAULT_LEVELS = {"deflate": 6, "zstd": 3}
+
+_FILE_HEADER = struct.Struct("<8sHH")
+_CHUNK_HEADER = struct.Struct("<4sQ")
+_THUMBNAIL_DIRECTORY = struct.Struct("<I")
+
+# Bytes read from the end of a JSON layout file to find the end of its content
+LEGACY_TAIL_SIZE = 64 * 1024
+_BASE64_TEXT = re.compile(rb"[A-Za-z0-9+/=\\]*")
+
+
+class QFSFormatError(ValueError):
+    """Raised when a file is not a readable QFS file."""
+
+
+def write_qfs(output_path, metadata, source, chunk_size=CHUNK_SIZE, codec=DEFAULT_CODEC, level=None, extra_chunks=(),
+              chunk_store=None):
+    """
+    Write a version 2 container, copying the payload from the binary file object `source`.
+
+    With a `codec` other than "none" the payload is compressed block by block
+    and the codec and uncompressed size are added to the metadata.
+    `extra_chunks` are (tag, bytes) pairs, such as pack_page_index() and
+    pack_thumbnails(), written between the metadata and the payload.
+
+    With a `chunk_store` (a chunkStore.ChunkStore) the payload goes into the
+    store and the file gets a CREF chunk listing its chunks instead of DATA.
+    The store compresses the chunks itself, so `codec` must be "none".
+    Returns the chunkStore.StoreResult in that mode, None otherwise.
+    """
+    if chunk_store is not None:
+        if codec != "none":
+            raise QFSFormatError("Payloads in a chunk store are compressed by the store, use codec \"none\"")
+        stored = chunk_store.put_stream(source)
+        metadata = dict(metadata, storage="chunks", payload_size=stored.payload_size, payload_sha256=stored.sha256)
+        with open(output_path, "wb") as output_file:
+            output_file.write(_FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+            _write_chunk(output_file, b"META", json.dumps(metadata).encode("utf-8"))
+            for tag, data in extra_chunks:
+                _write_chunk(output_file, tag, data)
+            _write_chunk(output_file, b"CREF", json.dumps({"chunks": stored.chunks}).encode("utf-8"))
+        return stored
+
+    compressor = _compressor(codec, level)
+    if compressor is not None:
+        metadata = dict(metadata, codec=codec, uncompressed_size=_remaining_size(source))
+
+    with open(output_path, "wb") as output_file:
+        output_file.write(_FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+        _write_chunk(output_file, b"META", json.dumps(metadata).encode("utf-8"))
+        for tag, data in extra_chunks:
+            _write_chunk(output_file, tag, data)
+        _write_stream_chunk(output_file, b"DATA", source, chunk_size, compressor)
+    return None
+
+
+def pack_page_index(pages):
+    """PIDX chunk for a list of (width, height, rotation) mediabox sizes in points."""
+    index = {"page_count": len(pages), "pages": [[round(width, 3), round(height, 3), rotation] for width, height, rotation in pages]}
+    return b"PIDX", json.dumps(index).encode("utf-8")
+
+
+def pack_thumbnails(images, image_format="png", size=None):
+    """THMB chunk for a list of encoded thumbnail images, one per page."""
+    entries = []
+    position = 0
+    for image in images:
+        entries.append([position, len(image)])
+        position += len(image)
+    directory = json.dumps({"format": image_format, "size": size, "entries": entries}).encode("utf-8")
+    return b"THMB", _THUMBNAIL_DIRECTORY.pack(len(directory)) + directory + b"".join(images)
+
+
+def _remaining_size(source):
+    """Number of bytes left to read in a seekable file object."""
+    position = source.tell()
+    end = source.seek(0, os.SEEK_END)
+    source.seek(position)
+    return end - position
+
+
+def _compressor(codec, level=None):
+    if codec == "none":
+        return None
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == "deflate":
+        return zlib.compressobj(level)
+    if codec == "zstd":
+        if zstandard is None:
+            raise QFSFormatError("The zstd codec needs the zstandard package (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    raise QFSFormatError(f"Unknown codec: {codec}")
+
+
+def _decompressor(codec):
+    if codec == "none":
+        return None
+    if codec == "deflate":
+        return zlib.decompressobj()
+    if codec == "zstd":
+        if zstandard is None:
+            raise QFSFormatError("This file is compressed with zstd, install the zstandard package to open it")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise QFSFormatError(f"Unknown codec: {codec}")
+
+
+def write_legacy_qfs(output_path, metadata, source, block_size=BASE64_BLOCK_SIZE):
+    """Write the original JSON layout, base64 encoding the payload from `source` block by block."""
+    with open(output_path, "wb") as output_file:
+        output_file.write(b'{"metadata": ' + json.dumps(metadata).encode("utf-8") + b', "content": "')
+        for encoded in iter_b64encode(source, block_size):
+            output_file.write(encoded)
+        output_file.write(b'"}')
+
+
+def _write_chunk(output_file, tag, data):
+    output_file.write(_CHUNK_HEADER.pack(tag, len(data)))
+    output_file.write(data)
+
+
+def _write_stream_chunk(output_file, tag, source, chunk_size, compressor=None):
+    """Copy `source` into a chunk block by block, optionally compressing it, and patch its length afterwards."""
+    header_offset = output_file.tell()
+    output_file.write(_CHUNK_HEADER.pack(tag, 0))
+
+    length = 0
+    while True:
+        block = source.read(chunk_size)
+        if not block:
+            break
+        if compressor is not None:
+            block = compressor.compress(block)
+        output_file.write(block)
+        length += len(block)
+    if compressor is not None:
+        block = compressor.flush()
+        output_file.write(block)
+        length += len(block)
+
+    end_offset = output_file.tell()
+    output_file.seek(header_offset)
+    output_file.write(_CHUNK_HEADER.pack(tag, length))
+    output_file.seek(end_offset)
+    return length
+
+
+def file_sha256(path, chunk_size=CHUNK_SIZE):
+    """Return the SHA-256 hex digest of a file, read block by block."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_metadata(path):
+    """Return the metadata of a QFS file, the payload is not read."""
+    with QFSReader(path) as reader:
+        return reader.metadata
+
+
+def read_header(path):
+    """
+    Return what the container says about a QFS file without reading the payload.
+
+    A dict with "path", "version", "codec", "payload_size", "stored_size",
+    "file_size", "modified" (mtime) and "metadata". Only the header and the
+    metadata are read, a few kilobytes whatever the size of the document.
+    "payload_size" is None for the JSON layout, whose decoded size is only
+    known after reading the whole content (see QFSReader.payload_size).
+    """
+    with QFSReader(path) as reader:
+        stat = os.fstat(reader._file.fileno())
+        return {
+            "path": path,
+            "version": reader.version,
+            "codec": reader.codec,
+            "payload_size": None if reader.version == LEGACY_VERSION else reader.payload_size,
+            "stored_size": reader.stored_size,
+            "file_size": stat.st_size,
+            "modified": stat.st_mtime,
+            "metadata": reader.metadata,
+        }
+
+
+class QFSReader:
+    """
+    Open a QFS file of any supported version and give access to its metadata and payload.
+
+    Payloads of files written in chunk store mode are read from `chunk_store`,
+    by default a chunkStore.ChunkStore at its default location. Every chunk
+    and the whole payload are checked against their SHA-256; after a
+    complete read `verified_sha256` holds the hash of the payload.
+    """
+
+    def __init__(self, path, chunk_store=None):
+        self.path = path
+        self.chunk_store = chunk_store
+        self.verified_sha256 = None
+        self.version = None
+        self.metadata = {}
+        self.chunks = {}  # tag -> (data offset, length)
+        self._content_span = None  # file offsets of the base64 content in the JSON layout
+        self._legacy_payload_size = None
+        self.codec = "none"
+        self._thumbnail_directory = None
+
+        self._file = open(path, "rb")
+        try:
+            self._read_header()
+        except Exception:
+            self._file.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def _read_header(self):
+        head = self._file.read(_FILE_HEADER.size)
+
+        if head.lstrip()[:1] == b"{":
+            self._read_legacy_header()
+            return
+
+        if len(head) < _FILE_HEADER.size:
+            raise QFSFormatError(f"{self.path} is too short to be a QFS file")
+        magic, version, _flags = _FILE_HEADER.unpack(head)
+        if magic != MAGIC:
+            raise QFSFormatError(f"{self.path} is not a QFS file")
+        if version > FORMAT_VERSION:
+            raise QFSFormatError(f"{self.path} uses QFS version {version}, this viewer reads up to {FORMAT_VERSION}")
+        self.version = version
+
+        # Walk the chunk headers, only the metadata is actually read
+        offset = _FILE_HEADER.size
+        while True:
+            self._file.seek(offset)
+            chunk_header = self._file.read(_CHUNK_HEADER.size)
+            if not chunk_header:
+                break
+            if len(chunk_header) < _CHUNK_HEADER.size:
+                raise QFSFormatError(f"{self.path} ends inside a chunk header")
+            tag, length = _CHUNK_HEADER.unpack(chunk_header)
+            data_offset = offset + _CHUNK_HEADER.size
+            self.chunks[tag.decode("ascii", "replace")] = (data_offset, length)
+            if tag == b"META":
+                with instrumentation.span("metadata parse"):
+                    self.metadata = json.loads(self._file.read(length).decode("utf-8"))
+            offset = data_offset + length
+
+        if "DATA" not in self.chunks and "CREF" not in self.chunks:
+            raise QFSFormatError(f"{self.path} has no payload")
+        self.codec = self.metadata.get("codec", "none")
+        # Fail early on unknown codecs or a missing zstandard package
+        _decompressor(self.codec)
+
+    def read_page_index(self):
+        """Return the PIDX page index as a dict, or None if the file has none."""
+        if "PIDX" not in self.chunks:
+            return None
+        offset, length = self.chunks["PIDX"]
+        self._file.seek(offset)
+        return json.loads(self._file.read(length).decode("utf-8"))
+
+    def read_thumbnail_directory(self):
+        """Return the THMB directory dict, or None if the file has no thumbnails."""
+        if "THMB" not in self.chunks:
+            return None
+        if self._thumbnail_directory is None:
+            offset, length = self.chunks["THMB"]
+            self._file.seek(offset)
+            (directory_length,) = _THUMBNAIL_DIRECTORY.unpack(self._file.read(_THUMBNAIL_DIRECTORY.size))
+            directory = json.loads(self._file.read(directory_length).decode("utf-8"))
+            directory["data_offset"] = offset + _THUMBNAIL_DIRECTORY.size + directory_length
+            self._thumbnail_directory = directory
+        return self._thumbnail_directory
+
+    def read_thumbnail(self, page_number):
+        """Return the encoded thumbnail of a page, or None."""
+        directory = self.read_thumbnail_directory()
+        if directory is None or not 0 <= page_number < len(directory["entries"]):
+            return None
+        position, length = directory["entries"][page_number]
+        self._file.seek(directory["data_offset"] + position)
+        return self._file.read(length)
+
+    def read_thumbnails(self):
+        """Return the encoded thumbnails of all pages, in one read, or an empty list."""
+        directory = self.read_thumbnail_directory()
+        if directory is None:
+            return []
+        offset, length = self.chunks["THMB"]
+        self._file.seek(directory["data_offset"])
+        data = self._file.read(offset + length - directory["data_offset"])
+        return [data[position:position + size] for position, size in directory["entries"]]
+
+    def _read_legacy_header(self):
+        with instrumentation.span("metadata parse"):
+            metadata, self._content_span = _scan_legacy_json(self._file)
+        self.version = LEGACY_VERSION
+        self.metadata = metadata
+
+    @property
+    def payload_size(self):
+        """Size of the stored payload in bytes, files in the JSON layout are read through to count it."""
+        if self.version == LEGACY_VERSION:
+            if self._legacy_payload_size is None:
+                self._legacy_payload_size = self._count_legacy_payload()
+            return self._legacy_payload_size
+        if "CREF" in self.chunks:
+            return self.metadata["payload_size"]
+        if self.codec != "none":
+            return self.metadata["uncompressed_size"]
+        return self.chunks["DATA"][1]
+
+    def _count_legacy_payload(self):
+        """Decoded size of the base64 content, counted on the unescaped text since escapes such as \\/ change its length."""
+        start, end = self._content_span
+        unescape = _JSONStringUnescaper()
+        length = 0
+        last = b""
+        self._file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = self._file.read(min(CHUNK_SIZE, remaining))
+            if not block:
+                raise QFSFormatError(f"{self.path} is truncated")
+            remaining -= len(block)
+            text = unescape.feed(block).translate(None, Base64StreamDecoder._IGNORED)
+            length += len(text)
+            last = (last + text)[-2:]
+        if length % 4:
+            # Unpadded text, Base64StreamDecoder pads the last group
+            return length // 4 * 3 + length % 4 - 1
+        return length // 4 * 3 - last.count(b"=")
+
+    @property
+    def stored_size(self):
+        """Number of bytes the payload takes in the file, only the chunk list for files in chunk store mode."""
+        if self.version == LEGACY_VERSION:
+            start, end = self._content_span
+            return end - start
+        if "CREF" in self.chunks:
+            return self.chunks["CREF"][1]
+        return self.chunks["DATA"][1]
+
+    def read_chunk_list(self):
+        """[[sha256, size], ...] of a file in chunk store mode."""
+        offset, length = self.chunks["CREF"]
+        self._file.seek(offset)
+        return json.loads(self._file.read(length).decode("utf-8"))["chunks"]
+
+    def _iter_stored_chunks(self):
+        """Yield the chunks of the payload from the chunk store, verified one by one and as a whole."""
+        import chunkStore
+
+        store = self.chunk_store or chunkStore.ChunkStore()
+        expected = self.metadata.get("payload_sha256")
+        digest = hashlib.sha256()
+        size = 0
+        with instrumentation.span("chunk store read"):
+            for chunk_digest, chunk_size in self.read_chunk_list():
+                chunk = store.get(chunk_digest, chunk_size)
+                digest.update(chunk)
+                size += len(chunk)
+                yield chunk
+        if size != self.payload_size or (expected and digest.hexdigest() != expected):
+            raise QFSFormatError(f"The chunks of {self.path} do not add up to its payload")
+        self.verified_sha256 = digest.hexdigest()
+
+    def iter_payload(self, chunk_size=CHUNK_SIZE):
+        """Yield the payload in blocks of about `chunk_size` bytes."""
+        if self.version == LEGACY_VERSION:
+            yield from self._iter_legacy_payload(chunk_size)
+            return
+
+        if "CREF" in self.chunks:
+            yield from self._iter_stored_chunks()
+            return
+
+        decompressor = _decompressor(self.codec)
+        offset, remaining = self.chunks["DATA"]
+        self._file.seek(offset)
+        while remaining > 0:
+            block = self._file.read(min(chunk_size, remaining))
+            if not block:
+                raise QFSFormatError(f"{self.path} is truncated")
+            remaining -= len(block)
+            if decompressor is not None:
+                block = decompressor.decompress(block)
+                if not block:
+                    continue
+            yield block
+
+        if decompressor is not None and hasattr(decompressor, "flush"):
+            block = decompressor.flush()
+            if block:
+                yield block
+
+    def _iter_legacy_payload(self, chunk_size):
+        """Decode the base64 "content" string of the JSON layout block by block."""
+        start, end = self._content_span
+        decoder = Base64StreamDecoder()
+        unescape = _JSONStringUnescaper()
+        # Read whole 4 character groups so most blocks decode without a remainder
+        read_size = max(4, chunk_size // 3 * 4)
+
+        self._file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = self._file.read(min(read_size, remaining))
+            if not block:
+                raise QFSFormatError(f"{self.path} is truncated")
+            remaining -= len(block)
+            decoded = decoder.feed(unescape.feed(block))
+            if decoded:
+                yield decoded
+
+        decoded = decoder.flush()
+        if decoded:
+            yield decoded
+
+    def read_payload(self):
+        """Return the whole payload as a bytes-like object."""
+        if self.version == LEGACY_VERSION:
+            payload = bytearray()
+            with instrumentation.span("base64 decode"):
+                for block in self._iter_legacy_payload(CHUNK_SIZE):
+                    payload += block
+            return payload
+
+        if self.codec != "none" or "CREF" in self.chunks:
+            payload = bytearray()
+            for block in self.iter_payload():
+                payload += block
+            if len(payload) != self.payload_size:
+                raise QFSFormatError(f"{self.path} decompressed to {len(payload)} bytes, expected {self.payload_size}")
+            return payload
+
+        offset, length = self.chunks["DATA"]
+        self._file.seek(offset)
+        payload = self._file.read(length)
+        if len(payload) != length:
+            raise QFSFormatError(f"{self.path} is truncated")
+        return payload
+
+
+# STREAMING BASE64 FOR THE JSON LAYOUT
+# The JSON layout stores the payload as one base64 string. Encoding and
+# decoding it in blocks of whole 3 byte / 4 character groups keeps memory use
+# constant no matter how large the document is.
+
+def iter_b64encode(source, block_size=BASE64_BLOCK_SIZE):
+    """Read the binary file object `source` and yield its base64 encoding in blocks."""
+    block_size -= block_size % 3
+    carry = b""
+    while True:
+        block = source.read(block_size)
+        if not block:
+            break
+        block = carry + block
+        cut = len(block) - len(block) % 3
+        carry = block[cut:]
+        if cut:
+            yield base64.b64encode(block[:cut])
+    if carry:
+        yield base64.b64encode(carry)
+
+
+class Base64StreamDecoder:
+    """Decode base64 text fed in pieces of any length, keeping incomplete 4 character groups for the next piece."""
+
+    _IGNORED = b" \t\r\n"
+
+    def __init__(self):
+        self.remainder = b""
+
+    def feed(self, data):
+        data = self.remainder + data.translate(None, self._IGNORED)
+        cut = len(data) - len(data) % 4
+        self.remainder = data[cut:]
+        return base64.b64decode(data[:cut]) if cut else b""
+
+    def flush(self):
+        if not self.remainder:
+            return b""
+        data, self.remainder = self.remainder, b""
+        return base64.b64decode(data + b"=" * (-len(data) % 4))
+
+
+class _JSONStringUnescaper:
+    """Undo JSON string escapes in the raw bytes of a string fed in pieces (base64 only ever needs \\/ and whitespace escapes)."""
+
+    _ESCAPES = {b"/": b"/", b"\\": b"\\", b"n": b"\n", b"r": b"\r", b"t": b"\t"}
+
+    def __init__(self):
+        self.pending_backslash = False
+
+    def feed(self, data):
+        if self.pending_backslash:
+            data = b"\\" + data
+            self.pending_backslash = False
+        if b"\\" not in data:
+            return data
+
+        parts = data.split(b"\\")
+        output = [parts[0]]
+        index = 1
+        while index < len(parts):
+            part = parts[index]
+            if part == b"" and index + 1 < len(parts):
+                # An escaped backslash splits into an empty part
+                output.append(b"\\" + parts[index + 1])
+                index += 2
+                continue
+            if part == b"":
+                # Backslash at the very end, its escape continues in the next piece
+                self.pending_backslash = True
+                break
+            output.append(self._ESCAPES.get(part[:1], b"") + part[1:])
+            index += 1
+        return b"".join(output)
+
+
+def _is_escaped(block, start, position, escaped_at_start):
+    """Check whether block[position] follows an odd run of backslashes, counting from `start`."""
+    count = 0
+    while position - count > start and block[position - count - 1] == 0x5C:
+        count += 1
+    if position - count == start and escaped_at_start:
+        count += 1
+    return count % 2 == 1
+
+
+def _find_content_end_in_tail(file, content_start, tail_size=LEGACY_TAIL_SIZE):
+    """
+    Find the closing quote of the content from the end of the file.
+
+    The converter writes "content" as the last key, so the file ends with a
+    long run of base64 followed by '"}'. Returns the file offset of the quote,
+    or None if the tail does not look like that and the content has to be
+    scanned.
+    """
+    file_size = os.fstat(file.fileno()).st_size
+    if file_size - content_start <= 2 * tail_size:
+        return None
+    # The caller goes on scanning from where it was if the tail does not match
+    position = file.tell()
+    file.seek(file_size - tail_size)
+    tail = file.read(tail_size)
+    quote = tail.find(b'"')
+    if quote == -1 or not _BASE64_TEXT.fullmatch(tail, 0, quote) or tail[quote + 1:].strip() != b"}":
+        file.seek(position)
+        return None
+    return file_size - tail_size + quote
+
+
+def _scan_legacy_json(file, block_size=CHUNK_SIZE):
+    """
+    Read the JSON layout without loading the base64 content into memory.
+
+    The top-level "content" string is skipped, by looking for its end in the
+    tail of the file when it is the last key and with bytes.find otherwise;
+    everything else is collected and parsed as JSON. Returns (metadata,
+    (start, end)) with the file offsets of the characters between the quotes
+    of "content".
+    """
+    skeleton = bytearray()
+    depth = 0
+    in_string = False
+    escape = False
+    key_start = None  # skeleton index of the current top-level key
+    expect_key = False
+    key = None
+    expect_value = False
+    in_content = False
+    content_start = content_end = None
+
+    file.seek(0)
+    offset = 0
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        index = 0
+        length = len(block)
+
+        while index < length:
+            if in_content:
+                # Base64 has no quotes, so the next unescaped quote ends the content
+                found = block.find(b'"', index)
+                while found != -1 and _is_escaped(block, index, found, escape):
+                    found = block.find(b'"', found + 1)
+                if found == -1:
+                    # Remember whether the block ends inside an escape sequence
+                    escape = _is_escaped(block, index, length, escape)
+                    index = length
+                    break
+                escape = False
+                content_end = offset + found
+                in_content = False
+                skeleton += b'""'
+                index = found + 1
+                continue
+
+            char = block[index:index + 1]
+            if in_string:
+                skeleton += char
+                if escape:
+                    escape = False
+                elif char == b"\\":
+                    escape = True
+                elif char == b'"':
+                    in_string = False
+                    if key_start is not None:
+                        key = json.loads(bytes(skeleton[key_start:]))
+                        key_start = None
+                index += 1
+                continue
+
+            if char == b'"':
+                if depth == 1 and expect_value and key == "content":
+                    in_content = True
+                    content_start = offset + index + 1
+                    expect_value = False
+                    content_end = _find_content_end_in_tail(file, content_start)
+                    if content_end is not None:
+                        # Continue right after the closing quote, the content is never read
+                        in_content = False
+                        skeleton += b'""'
+                        file.seek(content_end + 1)
+                        offset = content_end + 1 - length
+                        index = length
+                        continue
+                    index += 1
+                    continue
+                in_string = True
+                if depth == 1 and expect_key:
+                    key_start = len(skeleton)
+                    expect_key = False
+                expect_value = False
+                skeleton += char
+            else:
+                if char in b"{[":
+                    depth += 1
+                    expect_key = depth == 1 and char == b"{"
+                elif char in b"}]":
+                    depth -= 1
+                elif char == b"," and depth == 1:
+                    expect_key = True
+                elif char == b":" and depth == 1:
+                    expect_value = True
+                elif not char.isspace():
+                    expect_value = False
+                skeleton += char
+            index += 1
+        offset += length
+
+    if content_start is None or content_end is None:
+        raise QFSFormatError(f"{getattr(file, 'name', 'file')} has no content")
+    try:
+        data = json.loads(bytes(skeleton).decode("utf-8"))
+    except ValueError as e:
+        raise QFSFormatError(f"{getattr(file, 'name', 'file')} is not valid JSON: {e}")
+    return data["metadata"], (content_start, content_end)
@@ -0,0 +1,472 @@
+"""
+Background rasterization of PDF pages.
+
+PyMuPDF is not safe to use from several threads, so pages are rendered in a
+pool of worker processes. The payload of every open document, decoded once
+by the GUI process, is shared with the workers through shared memory; a
+worker copies it out and checks it against the document hash the first
+time it renders a page of the document, and keeps its own fitz.Document
+handle from then on. The GUI process keeps the queue of pending jobs, hands one job
+at a time to each idle worker and turns the results into QImages that are
+delivered through Qt signals.
+
+Workers also convert pages to SVG for vector printing (submit_svg), which
+is as slow as rasterizing and must not block the GUI thread either.
+"""
+import hashlib
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+from PyQt5.QtCore import QObject, QThread, QEventLoop, QTimer, pyqtSignal
+from PyQt5.QtGui import QImage
+
+import instrumentation
+
+
+# Job priorities, lower values are rendered first
+PRIORITY_PRINT = 0
+PRIORITY_VISIBLE = 1
+PRIORITY_PREFETCH = 2
+PRIORITY_THUMBNAIL = 3
+
+# Job kinds
+JOB_RASTER = "render"
+JOB_SVG = "svg"
+
+WORKER_CHECK_INTERVAL_MS = 1000  # How often busy workers are checked for having died
+
+
+def default_worker_count():
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def qimage_from_samples(samples, width, height, stride):
+    """
+    Wrap raw RGB samples received from a worker in a QImage without copying them again.
+
+    The samples are copied once in the worker (fitz.Pixmap.samples) and once
+    more through the result queue; only building the QImage in the GUI
+    process is free. QImage does not own memory it is constructed over, so
+    the buffer is kept alive as an attribute of the returned wrapper. Pass
+    the wrapper itself around (signals use `object` for this reason) and
+    convert it with QPixmap.fromImage or paint it directly; shallow QImage
+    copies made on the C++ side do not keep the buffer alive.
+    """
+    image = QImage(samples, width, height, stride, QImage.Format_RGB888)
+    image.samples_buffer = samples
+    return image
+
+
+def _worker_main(job_queue, result_queue, worker_id, timed=False):
+    """
+    Entry point of a render worker process.
+
+    With `timed`, the time spent opening documents and rasterizing is sent
+    back with every result for the instrumentation of the GUI process.
+    """
+    import fitz
+
+    sources = {}  # doc_key -> (shared memory name, payload size, SHA-256 of the payload), opened on first use
+    documents = {}
+
+    def open_document(doc_key, timings):
+        if doc_key not in documents:
+            start = time.perf_counter()
+            memory_name, size, doc_hash = sources[doc_key]
+            memory = shared_memory.SharedMemory(name=memory_name)
+            try:
+                payload = bytes(memory.buf[:size])
+            finally:
+                memory.close()
+            if hashlib.sha256(payload).hexdigest() != doc_hash:
+                raise ValueError("the shared payload does not match the document hash")
+            documents[doc_key] = fitz.open(stream=payload, filetype="pdf")
+            if timings is not None:
+                timings.append(("worker open", time.perf_counter() - start))
+        return documents[doc_key]
+
+    while True:
+        message = job_queue.get()
+        kind = message[0]
+
+        if kind == "stop":
+            break
+
+        elif kind == "open":
+            _, doc_key, memory_name, size, doc_hash = message
+            sources[doc_key] = (memory_name, size, doc_hash)
+
+        elif kind == "close":
+            _, doc_key = message
+            sources.pop(doc_key, None)
+            document = documents.pop(doc_key, None)
+            if document is not None:
+                document.close()
+
+        elif kind == "render":
+            _, job_id, doc_key, page_number, dpi, clip = message
+            timings = [] if timed else None  # (span name, seconds)
+            try:
+                document = open_document(doc_key, timings)
+                start = time.perf_counter()
+                page = document[page_number]
+                zoom = dpi / 72
+                if clip is None:
+                    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                else:
+                    # Clips are given in the coordinates of the page as displayed, with its rotation
+                    clip_rect = fitz.Rect(clip) * page.derotation_matrix
+                    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip_rect, alpha=False)
+                if timed:
+                    timings.append(("rasterize", time.perf_counter() - start))
+                result_queue.put((worker_id, job_id, pix.width, pix.height, pix.stride, pix.samples, None, timings))
+            except Exception as e:
+                result_queue.put((worker_id, job_id, 0, 0, 0, b"", str(e), timings))
+
+        elif kind == "svg":
+            _, job_id, doc_key, page_number = message
+            timings = [] if timed else None
+            try:
+                document = open_document(doc_key, timings)
+                start = time.perf_counter()
+                # Text stays text, drawing every glyph as a path is much slower to convert and to print
+                svg = document[page_number].get_svg_image(text_as_path=False).encode("utf-8")
+                if timed:
+                    timings.append(("svg convert", time.perf_counter() - start))
+                result_queue.put((worker_id, job_id, 0, 0, 0, svg, None, timings))
+            except Exception as e:
+                result_queue.put((worker_id, job_id, 0, 0, 0, b"", str(e), timings))
+
+    for document in documents.values():
+        document.close()
+
+
+class _ResultReader(QThread):
+    """Wait for worker results off the GUI thread and forward them as a signal."""
+
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, result_queue, parent=None):
+        super().__init__(parent)
+        self.result_queue = result_queue
+
+    def run(self):
+        while True:
+            result = self.result_queue.get()
+            if result is None:
+                break
+            self.resultReady.emit(result)
+
+
+class RenderService(QObject):
+    """Priority queue of (document, page, DPI) render jobs served by a pool of worker processes."""
+
+    # doc_key, page number, dpi, QImage from qimage_from_samples
+    pageRendered = pyqtSignal(str, int, float, object)
+    # doc_key, page number, dpi, error message
+    renderFailed = pyqtSignal(str, int, float, str)
+    # doc_key, page number, dpi, clip rectangle in points, QImage of the clipped area
+    tileRendered = pyqtSignal(str, int, float, object, object)
+    # doc_key, page number, dpi, clip rectangle in points, error message
+    tileFailed = pyqtSignal(str, int, float, object, str)
+    # doc_key, page number, SVG of the page as UTF-8 bytes
+    svgRendered = pyqtSignal(str, int, object)
+    # doc_key, page number, error message
+    svgFailed = pyqtSignal(str, int, str)
+
+    def __init__(self, worker_count=None, parent=None):
+        super().__init__(parent)
+        self.worker_count = worker_count or default_worker_count()
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = []  # (process, job queue)
+        self.idle_workers = []
+        self.result_queue = None
+        self.result_reader = None
+        self.worker_check_timer = None
+
+        self.documents = {}  # doc_key -> (SharedMemory holding the payload, payload size, SHA-256 of the payload)
+        self.doc_keys = itertools.count(1)
+        self.job_ids = itertools.count(1)
+        self.sequence = itertools.count()
+        self.pending = []  # heap of (priority, sequence, job_id)
+        self.jobs = {}  # job_id -> [doc_key, page number, dpi, priority, clip, subscriber count, kind]
+        self.job_lookup = {}  # (doc_key, page number, dpi, clip, kind) -> job_id
+        self.running = {}  # worker id -> job_id
+
+    def start(self):
+        """Start the worker processes, this is done on the first submitted job."""
+        if self.workers:
+            return
+        self.result_queue = self.context.Queue()
+        for worker_id in range(self.worker_count):
+            self.workers.append(self._spawn_worker(worker_id))
+            self.idle_workers.append(worker_id)
+
+        self.result_reader = _ResultReader(self.result_queue, self)
+        self.result_reader.resultReady.connect(self._on_result)
+        self.result_reader.start()
+
+        self.worker_check_timer = QTimer(self)
+        self.worker_check_timer.setInterval(WORKER_CHECK_INTERVAL_MS)
+        self.worker_check_timer.timeout.connect(self._check_workers)
+        self.worker_check_timer.start()
+
+    def _spawn_worker(self, worker_id):
+        job_queue = self.context.Queue()
+        process = self.context.Process(target=_worker_main, daemon=True,
+                                       args=(job_queue, self.result_queue, worker_id, instrumentation.is_enabled()))
+        process.start()
+        for doc_key, (memory, size, doc_hash) in self.documents.items():
+            job_queue.put(("open", doc_key, memory.name, size, doc_hash))
+        return process, job_queue
+
+    def shutdown(self):
+        """Stop all worker processes."""
+        if self.worker_check_timer is not None:
+            self.worker_check_timer.stop()
+            self.worker_check_timer = None
+        for process, job_queue in self.workers:
+            job_queue.put(("stop",))
+        for process, job_queue in self.workers:
+            process.join(2)
+            if process.is_alive():
+                process.terminate()
+        if self.result_reader is not None:
+            self.result_queue.put(None)
+            self.result_reader.wait()
+        self.workers = []
+        self.idle_workers = []
+        self.result_reader = None
+        # Nothing can render the documents still open any more
+        for doc_key in list(self.documents):
+            self._release_payload(self.documents.pop(doc_key)[0])
+
+    def open_document(self, payload, doc_hash):
+        """
+        Share the decoded payload of a document with the workers and return its key.
+
+        The payload is copied once into shared memory, the workers never read
+        or decode the QFS file again. `doc_hash` is the SHA-256 of the payload
+        the workers check their copy against.
+        """
+        doc_key = str(next(self.doc_keys))
+        size = len(payload)
+        memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        memory.buf[:size] = payload
+        self.documents[doc_key] = (memory, size, doc_hash)
+        for process, job_queue in self.workers:
+            job_queue.put(("open", doc_key, memory.name, size, doc_hash))
+        return doc_key
+
+    def close_document(self, doc_key):
+        """Cancel all jobs of a document and release its handles in the workers and its shared payload."""
+        self.cancel_document(doc_key)
+        document = self.documents.pop(doc_key, None)
+        if document is None:
+            return
+        for process, job_queue in self.workers:
+            job_queue.put(("close", doc_key))
+        # Workers copy the payload out when they open the document, a worker still to open it gets an error
+        self._release_payload(document[0])
+
+    def _release_payload(self, memory):
+        memory.close()
+        try:
+            memory.unlink()
+        except FileNotFoundError:
+            pass
+
+    def submit(self, doc_key, page_number, dpi, priority=PRIORITY_VISIBLE, clip=None):
+        """
+        Queue a page for rendering, a job already queued for the same page only gets its priority raised.
+
+        Every call subscribes to the job and has to be matched by a call to
+        cancel() if the result is no longer wanted; the job is only dropped
+        once all its subscribers cancelled it. Use raise_priority() to move a
+        job you already submitted up the queue.
+
+        With a clip rectangle (x0, y0, x1, y1) in points of the displayed page
+        only that area is rendered and the result is delivered by tileRendered
+        or tileFailed instead of pageRendered or renderFailed.
+        """
+        if clip is not None:
+            clip = tuple(float(value) for value in clip)
+        return self._submit(doc_key, page_number, float(dpi), priority, clip, JOB_RASTER)
+
+    def submit_svg(self, doc_key, page_number, priority=PRIORITY_PRINT):
+        """
+        Queue the conversion of a page to SVG, delivered by svgRendered or svgFailed.
+
+        Text is kept as text in the SVG. Subscribing and cancelling work as
+        with submit().
+        """
+        return self._submit(doc_key, page_number, 0.0, priority, None, JOB_SVG)
+
+    def _submit(self, doc_key, page_number, dpi, priority, clip, kind):
+        lookup_key = (doc_key, page_number, dpi, clip, kind)
+        job_id = self.job_lookup.get(lookup_key)
+
+        if job_id is not None:
+            self.jobs[job_id][5] += 1
+            self.raise_priority(job_id, priority)
+            return job_id
+
+        job_id = next(self.job_ids)
+        self.jobs[job_id] = [doc_key, page_number, dpi, priority, clip, 1, kind]
+        self.job_lookup[lookup_key] = job_id
+        heapq.heappush(self.pending, (priority, next(self.sequence), job_id))
+
+        self.start()
+        self._dispatch()
+        return job_id
+
+    def raise_priority(self, job_id, priority):
+        """
+        Move a queued job up to `priority` without subscribing to it again.
+
+        Returns False if the job is gone, its result was already delivered or
+        it failed, and it has to be submitted again.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        if priority < job[3] and job_id not in self.running.values():
+            job[3] = priority
+            heapq.heappush(self.pending, (priority, next(self.sequence), job_id))
+        return True
+
+    def cancel(self, job_id):
+        """
+        Unsubscribe from a job, it is forgotten once no subscriber is left.
+
+        A result that is already being rendered is dropped when it arrives.
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        job[5] -= 1
+        if job[5] <= 0:
+            self._forget(job_id)
+
+    def cancel_document(self, doc_key):
+        """Drop every job of a document, whoever subscribed to it."""
+        for job_id, job in list(self.jobs.items()):
+            if job[0] == doc_key:
+                self._forget(job_id)
+
+    def _forget(self, job_id):
+        job = self.jobs.pop(job_id, None)
+        if job is not None:
+            self.job_lookup.pop((job[0], job[1], job[2], job[4], job[6]), None)
+        return job
+
+    def _dispatch(self):
+        while self.idle_workers and self.pending:
+            priority, _, job_id = heapq.heappop(self.pending)
+            job = self.jobs.get(job_id)
+            # Skip cancelled jobs and stale heap entries of re-prioritized jobs
+            if job is None or job[3] != priority:
+                continue
+            worker_id = self.idle_workers.pop()
+            self.running[worker_id] = job_id
+            doc_key, page_number, dpi, _, clip, _, kind = job
+            if kind == JOB_SVG:
+                self.workers[worker_id][1].put((JOB_SVG, job_id, doc_key, page_number))
+            else:
+                self.workers[worker_id][1].put((JOB_RASTER, job_id, doc_key, page_number, dpi, clip))
+
+    def _on_result(self, result):
+        worker_id, job_id, width, height, stride, samples, error, timings = result
+        # A worker replaced after dying may have sent the result of its last job before it exited
+        if self.running.get(worker_id) == job_id:
+            del self.running[worker_id]
+            self.idle_workers.append(worker_id)
+        for name, seconds in timings or ():
+            instrumentation.record(name, seconds)
+
+        job = self._forget(job_id)
+        if job is not None and job[6] == JOB_SVG:
+            doc_key, page_number = job[:2]
+            if error is None:
+                instrumentation.count("svg convert", "pages")
+                self.svgRendered.emit(doc_key, page_number, samples)
+            else:
+                logging.warning(f"Failed to convert page {page_number + 1} to SVG: {error}")
+                self.svgFailed.emit(doc_key, page_number, error)
+        elif job is not None:
+            doc_key, page_number, dpi, _, clip, _, _ = job
+            if error is None:
+                with instrumentation.span("QImage build"):
+                    image = qimage_from_samples(samples, width, height, stride)
+                instrumentation.count("rasterize", "pages" if clip is None else "tiles")
+                instrumentation.count("rasterize", "pixels", width * height)
+                if clip is None:
+                    self.pageRendered.emit(doc_key, page_number, dpi, image)
+                else:
+                    self.tileRendered.emit(doc_key, page_number, dpi, clip, image)
+            else:
+                instrumentation.count("rasterize", "failures")
+                logging.warning(f"Failed to render page {page_number + 1} at {dpi:.0f} DPI: {error}")
+                if clip is None:
+                    self.renderFailed.emit(doc_key, page_number, dpi, error)
+                else:
+                    self.tileFailed.emit(doc_key, page_number, dpi, clip, error)
+
+        self._dispatch()
+
+    def _check_workers(self):
+        """Replace workers that died, the job they were rendering fails instead of waiting forever for a result."""
+        for worker_id, (process, job_queue) in enumerate(list(self.workers)):
+            if process.is_alive():
+                continue
+            logging.error(f"Render worker {worker_id} exited with code {process.exitcode}, starting a new one")
+            self.workers[worker_id] = self._spawn_worker(worker_id)
+            job_id = self.running.pop(worker_id, None)
+            if job_id is None:
+                continue
+            self.idle_workers.append(worker_id)
+            # Delivered like a failure reported by the worker itself
+            self._on_result((worker_id, job_id, 0, 0, 0, b"",
+                             f"The render worker exited with code {process.exitcode}", None))
+
+    def render_pages(self, doc_key, page_numbers, dpi):
+        """
+        Render pages at print priority and wait for all of them.
+
+        The Qt event loop keeps running while waiting, so the window stays
+        responsive. Returns a dict of page number -> QImage, pages that failed
+        to render are left out.
+        """
+        page_numbers = set(page_numbers)
+        results = {}
+        failed = set()
+        loop = QEventLoop()
+
+        def on_rendered(rendered_key, page_number, rendered_dpi, image):
+            if rendered_key == doc_key and rendered_dpi == float(dpi) and page_number in page_numbers:
+                results[page_number] = image
+                if len(results) + len(failed) == len(page_numbers):
+                    loop.quit()
+
+        def on_failed(failed_key, page_number, failed_dpi, message):
+            if failed_key == doc_key and failed_dpi == float(dpi) and page_number in page_numbers:
+                failed.add(page_number)
+                if len(results) + len(failed) == len(page_numbers):
+                    loop.quit()
+
+        self.pageRendered.connect(on_rendered)
+        self.renderFailed.connect(on_failed)
+        try:
+            for page_number in page_numbers:
+                self.submit(doc_key, page_number, dpi, PRIORITY_PRINT)
+            if page_numbers:
+                loop.exec_(QEventLoop.ExcludeUserInputEvents)
+        finally:
+            self.pageRendered.disconnect(on_rendered)
+            self.renderFailed.disconnect(on_failed)
+        return results
@@ -0,0 +1,126 @@
+"""
+Single-instance support for the viewer.
+
+The first viewer started listens on a QLocalServer (a named pipe on Windows,
+a Unix domain socket elsewhere). Later launches, for example double-clicking
+another .QFS file in Explorer, connect to it, send their file arguments and
+exit, and the running viewer opens the files as new tabs.
+
+Messages are one line of UTF-8 JSON per connection: {"files": [absolute paths]}.
+"""
+import getpass
+import json
+import logging
+import os
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+
+
+NEW_INSTANCE_FLAG = "--new-instance"
+
+
+def server_name():
+    """One server per user, so viewers of other users on the same machine are left alone."""
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = "user"
+    return f"CFViewer-{user}"
+
+
+def file_arguments(argv):
+    """The files given on a command line, options such as --startup-report are left out."""
+    return [os.path.abspath(arg) for arg in argv[1:] if not arg.startswith("--")]
+
+
+def forward_to_running_instance(file_paths, name=None, timeout_ms=500):
+    """
+    Send `file_paths` to a viewer that is already running.
+
+    Returns True if a running viewer took them, False if there is none and
+    this process should start the viewer itself.
+    """
+    socket = QLocalSocket()
+    socket.connectToServer(name or server_name())
+    if not socket.waitForConnected(timeout_ms):
+        return False
+
+    message = json.dumps({"files": [os.path.abspath(path) for path in file_paths]}) + "\n"
+    socket.write(message.encode("utf-8"))
+    sent = socket.waitForBytesWritten(timeout_ms)
+    socket.disconnectFromServer()
+    if socket.state() != QLocalSocket.UnconnectedState:
+        socket.waitForDisconnected(timeout_ms)
+    return sent
+
+
+def is_server_running(name=None, timeout_ms=500):
+    """Check whether a viewer is listening on `name` by connecting to it without sending anything."""
+    socket = QLocalSocket()
+    socket.connectToServer(name or server_name())
+    if not socket.waitForConnected(timeout_ms):
+        return False
+    socket.disconnectFromServer()
+    if socket.state() != QLocalSocket.UnconnectedState:
+        socket.waitForDisconnected(timeout_ms)
+    return True
+
+
+class InstanceServer(QObject):
+    """Receive the file arguments of later launches and emit them with filesReceived."""
+
+    filesReceived = pyqtSignal(list)
+
+    def __init__(self, name=None, parent=None):
+        super().__init__(parent)
+        self.name = name or server_name()
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self.on_new_connection)
+        self.buffers = {}  # socket -> bytes received so far
+
+    def listen(self):
+        """Start listening, returns False if another process already owns the name."""
+        if self.server.listen(self.name):
+            return True
+        # Another viewer started at the same time owns the name, its socket must not be taken over
+        if is_server_running(self.name):
+            logging.info(f"Another viewer is already listening on {self.name}.")
+            return False
+        # A viewer that crashed leaves its socket file behind on Unix
+        QLocalServer.removeServer(self.name)
+        if self.server.listen(self.name):
+            return True
+        logging.warning(f"Single-instance server could not listen on {self.name}: {self.server.errorString()}")
+        return False
+
+    def close(self):
+        self.server.close()
+
+    def on_new_connection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.buffers[socket] = b""
+            socket.readyRead.connect(lambda socket=socket: self.on_ready_read(socket))
+            socket.disconnected.connect(lambda socket=socket: self.on_disconnected(socket))
+
+    def on_ready_read(self, socket):
+        self.buffers[socket] = self.buffers.get(socket, b"") + bytes(socket.readAll())
+        while b"\n" in self.buffers[socket]:
+            line, self.buffers[socket] = self.buffers[socket].split(b"\n", 1)
+            self.handle_message(line)
+
+    def on_disconnected(self, socket):
+        remaining = self.buffers.pop(socket, b"")
+        if remaining.strip():
+            self.handle_message(remaining)
+        socket.deleteLater()
+
+    def handle_message(self, line):
+        try:
+            files = json.loads(line.decode("utf-8"))["files"]
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Ignoring malformed message from another viewer: {e}")
+            return
+        logging.info(f"Received {len(files)} file(s) from another launch of the viewer.")
+        self.filesReceived.emit([str(path) for path in files])
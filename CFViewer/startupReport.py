@@ -0,0 +1,119 @@
+"""
+Startup report built into the viewer, along the lines of `python -X importtime`.
+
+Start the viewer with --startup-report, or with QFS_STARTUP_REPORT=1 in the
+environment, to record the time spent in every import and the moments the
+launch reached its milestones (imports done, splash shown, window shown).
+The report is written to stderr and to startup_report.txt in the CFV folder
+of %APPDATA%, since the frozen .exe has no console.
+
+This module has to be imported, and enable_if_requested() called, before the
+imports that should be measured.
+"""
+import builtins
+import os
+import sys
+import time
+
+
+PROCESS_START = time.perf_counter()
+REPORT_FLAG = "--startup-report"
+
+
+class ImportTimer:
+    """Wrap builtins.__import__ and record self and cumulative time of every new import."""
+
+    def __init__(self):
+        self.records = []  # (depth, module name, self seconds, cumulative seconds) in completion order
+        self.child_time = []  # Time spent in nested imports, one entry per import in progress
+        self.original_import = None
+
+    def install(self):
+        if self.original_import is None:
+            self.original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            self.original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Modules already loaded cost a dictionary lookup, only time the first import
+        if level == 0 and name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+
+        start = time.perf_counter()
+        self.child_time.append(0.0)
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self.child_time.pop()
+            if self.child_time:
+                self.child_time[-1] += elapsed
+            if level > 0 and globals:
+                name = f"{globals.get('__package__')}.{name}" if name else globals.get("__package__")
+            self.records.append((len(self.child_time), name, elapsed - children, elapsed))
+
+
+_timer = None
+_marks = []  # (label, seconds since PROCESS_START)
+
+
+def is_enabled():
+    return _timer is not None
+
+
+def enable():
+    global _timer
+    if _timer is None:
+        _timer = ImportTimer()
+        _timer.install()
+
+
+def enable_if_requested(argv=None):
+    """Enable the report if the command line or the environment asks for it."""
+    argv = sys.argv if argv is None else argv
+    if REPORT_FLAG in argv or os.environ.get("QFS_STARTUP_REPORT", "") not in ("", "0"):
+        enable()
+
+
+def mark(label):
+    """Record that the launch reached a milestone, does nothing unless the report is enabled."""
+    if _timer is not None:
+        _marks.append((label, time.perf_counter() - PROCESS_START))
+
+
+def report(top=30):
+    """Return the report as text: the milestones, then the slowest imports like -X importtime."""
+    lines = ["Startup milestones (seconds since the process started):"]
+    for label, seconds in _marks:
+        lines.append(f"  {seconds:8.3f}  {label}")
+
+    records = _timer.records if _timer is not None else []
+    slowest = sorted(records, key=lambda record: record[3], reverse=True)[:top]
+    lines.append("")
+    lines.append(f"Slowest imports (top {len(slowest)} of {len(records)}):")
+    lines.append("import time: self [us] | cumulative | imported package")
+    for depth, name, self_seconds, cumulative_seconds in slowest:
+        lines.append(f"import time: {self_seconds * 1e6:9.0f} | {cumulative_seconds * 1e6:10.0f} | {'  ' * depth}{name}")
+    return "\n".join(lines)
+
+
+def default_report_path():
+    return os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "CFV", "startup_report.txt")
+
+
+def write_report(path=None):
+    """Write the report to stderr and to `path`, returns the path or None if the report is disabled."""
+    if _timer is None:
+        return None
+    text = report()
+    if sys.stderr is not None:
+        print(text, file=sys.stderr)
+    path = path or default_report_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as report_file:
+        report_file.write(text + "\n")
+    return path
@@ -0,0 +1,90 @@
+"""
+Dock showing the per-stage timings collected by instrumentation.py.
+
+Only created when the viewer runs with instrumentation enabled. The table
+is refreshed once a second while the dock is visible, and the stats can be
+exported to JSON or CSV or reset from the dock.
+"""
+import logging
+
+from PyQt5.QtWidgets import QDockWidget, QTableWidget, QTableWidgetItem, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog, QHeaderView
+from PyQt5.QtCore import Qt, QTimer
+
+import instrumentation
+
+
+COLUMNS = ["Span", "Calls", "Total ms", "Mean ms", "p50 ms", "p95 ms", "Max ms", "Counters"]
+
+
+class StatsDock(QDockWidget):
+    """Table of the instrumentation spans with Export and Reset buttons."""
+
+    def __init__(self, parent=None):
+        super().__init__("Performance Stats", parent)
+        self.setObjectName("statsDock")
+
+        widget = QWidget(self)
+        layout = QVBoxLayout(widget)
+        layout.setContentsMargins(4, 4, 4, 4)
+
+        self.table = QTableWidget(0, len(COLUMNS), widget)
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        export_button = QPushButton("Export...", widget)
+        export_button.clicked.connect(self.export)
+        buttons.addWidget(export_button)
+        reset_button = QPushButton("Reset", widget)
+        reset_button.clicked.connect(self.reset)
+        buttons.addWidget(reset_button)
+        buttons.addStretch()
+        layout.addLayout(buttons)
+        self.setWidget(widget)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self.on_visibility_changed)
+
+    def on_visibility_changed(self, visible):
+        if visible:
+            self.refresh()
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+
+    def refresh(self):
+        rows = instrumentation.snapshot()
+        self.table.setRowCount(len(rows))
+        for row_number, row in enumerate(rows):
+            counters = " ".join(f"{name}={value}" for name, value in row["counters"].items())
+            values = [row["name"], str(row["calls"])] + [
+                f"{row[key] * 1000:.2f}" for key in ("total_seconds", "mean_seconds", "p50_seconds", "p95_seconds", "max_seconds")
+            ] + [counters]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if 0 < column < len(values) - 1:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row_number, column, item)
+
+    def reset(self):
+        instrumentation.reset()
+        self.refresh()
+
+    def export(self):
+        path, selected_filter = QFileDialog.getSaveFileName(self, "Export Performance Stats", "stats.json",
+                                                            "JSON Files (*.json);;CSV Files (*.csv)")
+        if not path:
+            return
+        try:
+            if path.lower().endswith(".csv") or selected_filter.startswith("CSV"):
+                instrumentation.export_csv(path)
+            else:
+                instrumentation.export_json(path)
+        except OSError as e:
+            logging.error(f"Could not export the performance stats to {path}: {e}")
@@ -0,0 +1,91 @@
+import io
+import os
+import random
+
+import pytest
+
+import chunkStore
+import qfsFormat
+
+
+def synthetic_pdf(object_count, seed=1):
+    """A payload shaped like a PDF, objects of random sizes each starting with an "n 0 obj" header."""
+    generator = random.Random(seed)
+    objects = [b"\n%d 0 obj\n" % number + generator.randbytes(generator.randint(100, 30000))
+               for number in range(object_count)]
+    return b"%PDF-1.7" + b"".join(objects)
+
+
+@pytest.mark.parametrize("read_size", [1000, 4096, 65536, chunkStore.READ_SIZE])
+def test_boundaries_do_not_depend_on_read_size(read_size):
+    data = synthetic_pdf(300)
+    expected = [len(chunk) for chunk in chunkStore.iter_chunks(io.BytesIO(data))]
+    chunks = list(chunkStore.iter_chunks(io.BytesIO(data), read_size))
+    assert b"".join(chunks) == data
+    assert [len(chunk) for chunk in chunks] == expected
+
+
+def test_chunks_end_before_object_headers():
+    data = synthetic_pdf(300)
+    chunks = list(chunkStore.iter_chunks(io.BytesIO(data)))
+    assert all(len(chunk) <= chunkStore.MAX_CHUNK_SIZE for chunk in chunks)
+    assert all(len(chunk) >= chunkStore.MIN_CHUNK_SIZE for chunk in chunks[:-1])
+    for chunk in chunks[1:]:
+        # Every boundary is placed right after the line break that starts an object
+        assert chunk.split(b"\n", 1)[0].endswith(b" 0 obj")
+
+
+def test_payload_without_objects_is_cut_in_max_size_blocks():
+    data = os.urandom(3 * chunkStore.MAX_CHUNK_SIZE + 10).replace(b"\n", b"-").replace(b"\r", b"-")
+    chunks = list(chunkStore.iter_chunks(io.BytesIO(data)))
+    assert [len(chunk) for chunk in chunks] == [chunkStore.MAX_CHUNK_SIZE] * 3 + [10]
+
+
+def test_empty_payload():
+    assert list(chunkStore.iter_chunks(io.BytesIO(b""))) == []
+
+
+def test_store_deduplicates_unchanged_chunks(tmp_path):
+    store = chunkStore.ChunkStore(tmp_path / "store")
+    data = synthetic_pdf(300)
+    first = store.put_stream(io.BytesIO(data))
+    assert first.payload_size == len(data)
+    assert first.new_bytes == len(data)
+
+    again = store.put_stream(io.BytesIO(data))
+    assert again.chunks == first.chunks
+    assert again.new_chunks == 0
+
+    # An edit inside one object only adds the chunks around it
+    position = len(data) // 2
+    edited = data[:position] + b"edited" + data[position + 6:]
+    revision = store.put_stream(io.BytesIO(edited))
+    assert 0 < revision.new_chunks <= 2
+    assert revision.new_bytes < len(data) // 4
+
+
+def test_get_checks_the_hash(tmp_path):
+    store = chunkStore.ChunkStore(tmp_path / "store")
+    digest, new = store.put(b"chunk data")
+    assert new
+    assert store.get(digest, 10) == b"chunk data"
+    assert store.put(b"chunk data") == (digest, False)
+
+    with open(store.chunk_path(digest), "wb") as chunk_file:
+        chunk_file.write(b"not zlib")
+    with pytest.raises(chunkStore.ChunkStoreError):
+        store.get(digest)
+    with pytest.raises(chunkStore.ChunkStoreError):
+        store.get("0" * 64)
+
+
+def test_qfs_round_trip_through_the_store(tmp_path):
+    store = chunkStore.ChunkStore(tmp_path / "store")
+    data = synthetic_pdf(100)
+    path = tmp_path / "file.qfs"
+    qfsFormat.write_qfs(path, {"file_name": "a.pdf", "original_type": "pdf"}, io.BytesIO(data), chunk_store=store)
+
+    with qfsFormat.QFSReader(path, chunk_store=store) as reader:
+        assert reader.payload_size == len(data)
+        assert bytes(reader.read_payload()) == data
+        assert reader.verified_sha256 == reader.metadata["payload_sha256"]
@@ -0,0 +1,96 @@
+from pageCache import PageCache, page_key, image_nbytes
+
+
+MB = 1024 * 1024
+
+
+class FakeImage:
+    """Stands in for a QImage or QPixmap, only its size is used by the cache."""
+
+    def __init__(self, width, height, depth=24):
+        self._width = width
+        self._height = height
+        self._depth = depth
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def depth(self):
+        return self._depth
+
+
+def test_image_nbytes():
+    assert image_nbytes(FakeImage(100, 50)) == 100 * 50 * 3
+    assert image_nbytes(FakeImage(100, 50, depth=1)) == 100 * 50
+
+
+def test_eviction_keeps_the_tier_within_its_budget():
+    cache = PageCache({"screen": 3})
+    for page in range(5):
+        cache.put("screen", page_key("doc", page), f"page {page}", nbytes=MB)
+    assert cache.used["screen"] <= 3 * MB
+    assert cache.evictions["screen"] == 2
+    assert cache.get("screen", page_key("doc", 0)) is None
+    assert cache.get("screen", page_key("doc", 4)) == "page 4"
+
+
+def test_least_recently_used_is_evicted_first():
+    cache = PageCache({"screen": 2})
+    cache.put("screen", "a", "A", nbytes=MB)
+    cache.put("screen", "b", "B", nbytes=MB)
+    assert cache.get("screen", "a") == "A"
+    cache.put("screen", "c", "C", nbytes=MB)
+    assert cache.get("screen", "b") is None
+    assert cache.get("screen", "a") == "A"
+
+
+def test_values_larger_than_the_budget_are_not_cached():
+    cache = PageCache({"screen": 1})
+    cache.put("screen", "small", "S", nbytes=MB // 2)
+    cache.put("screen", "huge", "H", nbytes=2 * MB)
+    assert cache.get("screen", "huge") is None
+    assert cache.get("screen", "small") == "S"
+
+
+def test_replacing_a_key_does_not_count_twice():
+    cache = PageCache({"screen": 2})
+    cache.put("screen", "a", "A", nbytes=MB)
+    cache.put("screen", "a", "A2", nbytes=MB)
+    assert cache.used["screen"] == MB
+    assert cache.get("screen", "a") == "A2"
+
+
+def test_tiers_have_separate_budgets():
+    cache = PageCache({"screen": 1, "thumbnails": 1})
+    cache.put("thumbnails", "t", "T", nbytes=MB)
+    cache.put("screen", "s1", "S1", nbytes=MB)
+    cache.put("screen", "s2", "S2", nbytes=MB)
+    assert cache.get("thumbnails", "t") == "T"
+
+
+def test_shrinking_a_budget_evicts():
+    cache = PageCache({"screen": 4})
+    for key in "abcd":
+        cache.put("screen", key, key, nbytes=MB)
+    cache.set_budget("screen", 2)
+    assert len(cache.tiers["screen"]) == 2
+    assert cache.used["screen"] == 2 * MB
+
+
+def test_discard_document_and_stats():
+    cache = PageCache({"screen": 4})
+    cache.put("screen", page_key("one", 0), "1", nbytes=MB)
+    cache.put("screen", page_key("two", 0), "2", nbytes=MB)
+    cache.discard_document("one")
+    assert cache.get("screen", page_key("one", 0)) is None
+    stats = cache.stats()["screen"]
+    assert stats["entries"] == 1
+    assert stats["used_mb"] == 1
+    assert stats["misses"] == 1
+
+
+def test_page_key_rounds_zoom_and_dpi():
+    assert page_key("doc", 1, zoom=1.00001, dpi=150.0001) == page_key("doc", 1, zoom=1.0, dpi=150)
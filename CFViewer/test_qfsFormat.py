@@ -0,0 +1,176 @@
+import base64
+import io
+import json
+import os
+
+import pytest
+
+import qfsFormat
+
+
+METADATA = {"file_name": "drawing.pdf", "original_type": "pdf"}
+SIZES = [0, 1, 2, 3, 70000, 3 * 1024 * 1024 + 7]
+
+
+def payload_of(size):
+    return os.urandom(size)
+
+
+def write_json(path, text):
+    with open(path, "w") as output_file:
+        output_file.write(text)
+
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("codec", ["none", "deflate"])
+def test_v2_round_trip(tmp_path, size, codec):
+    payload = payload_of(size)
+    path = tmp_path / "file.qfs"
+    qfsFormat.write_qfs(path, METADATA, io.BytesIO(payload), codec=codec)
+
+    with qfsFormat.QFSReader(path) as reader:
+        assert reader.version == qfsFormat.FORMAT_VERSION
+        assert reader.metadata["file_name"] == "drawing.pdf"
+        assert reader.payload_size == size
+        assert bytes(reader.read_payload()) == payload
+        assert b"".join(reader.iter_payload(chunk_size=4096)) == payload
+
+
+def test_v2_zstd_round_trip(tmp_path):
+    pytest.importorskip("zstandard")
+    payload = payload_of(200000)
+    path = tmp_path / "file.qfs"
+    qfsFormat.write_qfs(path, METADATA, io.BytesIO(payload), codec="zstd")
+    with qfsFormat.QFSReader(path) as reader:
+        assert bytes(reader.read_payload()) == payload
+
+
+def test_v2_page_index_and_thumbnails(tmp_path):
+    path = tmp_path / "file.qfs"
+    thumbnails = [b"first", b"", b"third image"]
+    extra_chunks = [qfsFormat.pack_page_index([(595.0, 842.0, 0), (842.0, 595.0, 90)]),
+                    qfsFormat.pack_thumbnails(thumbnails, size=160)]
+    qfsFormat.write_qfs(path, METADATA, io.BytesIO(b"%PDF"), extra_chunks=extra_chunks)
+
+    with qfsFormat.QFSReader(path) as reader:
+        assert reader.read_page_index() == {"page_count": 2, "pages": [[595.0, 842.0, 0], [842.0, 595.0, 90]]}
+        assert reader.read_thumbnails() == thumbnails
+        assert reader.read_thumbnail(2) == b"third image"
+        assert bytes(reader.read_payload()) == b"%PDF"
+
+
+def test_v2_truncated_payload(tmp_path):
+    path = tmp_path / "file.qfs"
+    qfsFormat.write_qfs(path, METADATA, io.BytesIO(payload_of(10000)))
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) - 100)
+    with qfsFormat.QFSReader(path) as reader:
+        with pytest.raises(qfsFormat.QFSFormatError):
+            reader.read_payload()
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_legacy_round_trip(tmp_path, size):
+    payload = payload_of(size)
+    path = tmp_path / "file.qfs"
+    qfsFormat.write_legacy_qfs(path, METADATA, io.BytesIO(payload), block_size=3 * 1024)
+
+    with qfsFormat.QFSReader(path) as reader:
+        assert reader.version == qfsFormat.LEGACY_VERSION
+        assert reader.metadata == METADATA
+        assert reader.payload_size == size
+        assert bytes(reader.read_payload()) == payload
+
+
+@pytest.mark.parametrize("size", [0, 70000, 3 * 1024 * 1024])
+@pytest.mark.parametrize("content_first", [True, False])
+def test_legacy_key_order(tmp_path, size, content_first):
+    payload = payload_of(size)
+    content = base64.b64encode(payload).decode("ascii")
+    document = {"content": content, "metadata": METADATA} if content_first else {"metadata": METADATA, "content": content}
+    path = tmp_path / "file.qfs"
+    write_json(path, json.dumps(document))
+
+    with qfsFormat.QFSReader(path) as reader:
+        assert reader.metadata == METADATA
+        assert reader.payload_size == size
+        assert bytes(reader.read_payload()) == payload
+
+
+@pytest.mark.parametrize("size", [70000, 70001, 70002, 3 * 1024 * 1024])
+@pytest.mark.parametrize("content_first", [True, False])
+def test_legacy_escaped_slashes(tmp_path, size, content_first):
+    payload = payload_of(size)
+    content = base64.b64encode(payload).decode("ascii")
+    document = {"content": content, "metadata": METADATA} if content_first else {"metadata": METADATA, "content": content}
+    path = tmp_path / "file.qfs"
+    # Encoders such as PHP's json_encode write every "/" as "\/"
+    write_json(path, json.dumps(document).replace("/", "\\/"))
+
+    with qfsFormat.QFSReader(path) as reader:
+        assert reader.payload_size == size
+        assert bytes(reader.read_payload()) == payload
+
+
+def test_legacy_line_breaks(tmp_path):
+    payload = payload_of(50000)
+    # MIME style base64 with a line break every 76 characters, escaped as \n in the JSON string
+    content = base64.encodebytes(payload).decode("ascii")
+    path = tmp_path / "file.qfs"
+    write_json(path, json.dumps({"metadata": METADATA, "content": content}))
+
+    with qfsFormat.QFSReader(path) as reader:
+        assert reader.payload_size == len(payload)
+        assert bytes(reader.read_payload()) == payload
+
+
+def test_legacy_without_content(tmp_path):
+    path = tmp_path / "file.qfs"
+    write_json(path, json.dumps({"metadata": METADATA}))
+    with pytest.raises(qfsFormat.QFSFormatError):
+        qfsFormat.QFSReader(path)
+
+
+def test_read_header(tmp_path):
+    v2_path = tmp_path / "v2.qfs"
+    qfsFormat.write_qfs(v2_path, METADATA, io.BytesIO(payload_of(1000)))
+    header = qfsFormat.read_header(v2_path)
+    assert header["version"] == qfsFormat.FORMAT_VERSION
+    assert header["payload_size"] == 1000
+    assert header["metadata"]["file_name"] == "drawing.pdf"
+
+    legacy_path = tmp_path / "legacy.qfs"
+    qfsFormat.write_legacy_qfs(legacy_path, METADATA, io.BytesIO(payload_of(1000)))
+    header = qfsFormat.read_header(legacy_path)
+    assert header["version"] == qfsFormat.LEGACY_VERSION
+    # Counting the decoded size of the JSON layout means reading all of it
+    assert header["payload_size"] is None
+    assert header["stored_size"] == len(base64.b64encode(bytes(1000)))
+
+
+def test_base64_stream_decoder_any_piece_size():
+    payload = payload_of(1000)
+    encoded = base64.encodebytes(payload)
+    for piece_size in (1, 3, 4, 7, 77, 1000):
+        decoder = qfsFormat.Base64StreamDecoder()
+        decoded = b"".join(decoder.feed(encoded[start:start + piece_size]) for start in range(0, len(encoded), piece_size))
+        assert decoded + decoder.flush() == payload
+
+
+def test_base64_stream_decoder_unpadded():
+    decoder = qfsFormat.Base64StreamDecoder()
+    assert decoder.feed(b"YWJjZA") + decoder.flush() == b"abcd"
+
+
+def test_b64encode_blocks():
+    payload = payload_of(100000)
+    encoded = b"".join(qfsFormat.iter_b64encode(io.BytesIO(payload), block_size=3 * 100))
+    assert encoded == base64.b64encode(payload)
+
+
+@pytest.mark.parametrize("piece_size", [1, 2, 3, 5, 1000])
+def test_json_string_unescaper_split_escapes(piece_size):
+    raw = b"ab\\/cd\\\\ef\\nxy\\/\\/z\\t"
+    unescape = qfsFormat._JSONStringUnescaper()
+    text = b"".join(unescape.feed(raw[start:start + piece_size]) for start in range(0, len(raw), piece_size))
+    assert text == b"ab/cd\\ef\nxy//z\t"
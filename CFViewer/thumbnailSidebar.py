@@ -0,0 +1,168 @@
+from PyQt5.QtWidgets import QListWidget, QListWidgetItem, QListView
+from PyQt5.QtCore import Qt, QSize, QPoint, QTimer, pyqtSignal
+from PyQt5.QtGui import QPixmap, QIcon
+
+from pageCache import thumbnail_key
+from renderService import PRIORITY_THUMBNAIL
+
+
+THUMBNAIL_SIZE = 120  # Largest edge of a thumbnail in the sidebar, in pixels
+
+
+class ThumbnailSidebar(QListWidget):
+    """
+    Strip of page thumbnails next to the pages of a tab.
+
+    Thumbnails come from the images embedded by the converter when the file
+    has them, and are otherwise rendered at a low DPI by the render service
+    with the lowest priority. Like the pages, only the thumbnails near the
+    visible rows are loaded. They are cached in the "thumbnails" tier of the
+    page cache, apart from the full pages. Clicking a thumbnail or moving
+    through the list with the keyboard emits pageSelected.
+    """
+
+    pageSelected = pyqtSignal(int)
+
+    def __init__(self, render_service, page_cache, document, prefetch_screens=1, drop_screens=5, parent=None):
+        super().__init__(parent)
+        self.render_service = render_service
+        self.page_cache = page_cache
+        self.document = document
+        self.prefetch_screens = prefetch_screens
+        self.drop_screens = drop_screens
+        self.loaded = set()
+        self.requested = {}  # page number -> (render job id, dpi)
+        self.row_at_press = -1  # Current row when the mouse button went down
+
+        self.setViewMode(QListView.IconMode)
+        self.setFlow(QListView.TopToBottom)
+        self.setWrapping(False)
+        self.setMovement(QListView.Static)
+        self.setUniformItemSizes(True)
+        self.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.setSpacing(4)
+        self.setFixedWidth(THUMBNAIL_SIZE + 40)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+
+        for page_num in range(document.page_count):
+            item = QListWidgetItem(str(page_num + 1))
+            item.setTextAlignment(Qt.AlignHCenter)
+            item.setSizeHint(QSize(THUMBNAIL_SIZE + 16, THUMBNAIL_SIZE + 24))
+            self.addItem(item)
+
+        # Coalesce bursts of scroll and resize events into one update
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(15)
+        self.update_timer.timeout.connect(self.update_visible_thumbnails)
+
+        self.verticalScrollBar().valueChanged.connect(self.schedule_update)
+        self.currentRowChanged.connect(self.on_current_row_changed)
+        self.itemClicked.connect(self.on_item_clicked)
+        render_service.pageRendered.connect(self.on_page_rendered)
+
+    def schedule_update(self, *args):
+        self.update_timer.start()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.schedule_update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.schedule_update()
+
+    def visible_rows(self):
+        """(first, last) rows at least partly in view."""
+        first = self.indexAt(QPoint(self.viewport().width() // 2, 1)).row()
+        last = self.indexAt(QPoint(self.viewport().width() // 2, self.viewport().height() - 2)).row()
+        if first == -1:
+            first = 0
+        if last == -1:
+            last = self.count() - 1
+        return first, last
+
+    def thumbnail_dpi(self, page_num):
+        width, height = self.document.page_sizes[page_num]
+        return 72 * THUMBNAIL_SIZE / max(width, height)
+
+    def update_visible_thumbnails(self):
+        """Load the thumbnails of the rows in or near the view and drop the ones far away from it."""
+        if not self.isVisible() or self.count() == 0:
+            return
+
+        first, last = self.visible_rows()
+        rows_per_screen = last - first + 1
+        load_first = max(0, first - rows_per_screen * self.prefetch_screens)
+        load_last = min(self.count() - 1, last + rows_per_screen * self.prefetch_screens)
+        keep_first = first - rows_per_screen * self.drop_screens
+        keep_last = last + rows_per_screen * self.drop_screens
+
+        for page_num in range(load_first, load_last + 1):
+            if page_num in self.loaded or page_num in self.requested:
+                continue
+            pixmap = self.page_cache.get("thumbnails", thumbnail_key(self.document.doc_hash, page_num))
+            if pixmap is None and page_num < len(self.document.thumbnails):
+                pixmap = QPixmap()
+                if pixmap.loadFromData(self.document.thumbnails[page_num]):
+                    self.page_cache.put("thumbnails", thumbnail_key(self.document.doc_hash, page_num), pixmap)
+                else:
+                    pixmap = None
+            if pixmap is not None:
+                self.show_thumbnail(page_num, pixmap)
+                continue
+            dpi = self.thumbnail_dpi(page_num)
+            job_id = self.render_service.submit(self.document.doc_key, page_num, dpi, PRIORITY_THUMBNAIL)
+            self.requested[page_num] = (job_id, float(dpi))
+
+        for page_num in [page_num for page_num in self.loaded if not keep_first <= page_num <= keep_last]:
+            self.item(page_num).setIcon(QIcon())
+            self.loaded.discard(page_num)
+        for page_num in [page_num for page_num in self.requested if not keep_first <= page_num <= keep_last]:
+            self.render_service.cancel(self.requested.pop(page_num)[0])
+
+    def on_page_rendered(self, doc_key, page_num, dpi, image):
+        if doc_key != self.document.doc_key:
+            return
+        request = self.requested.get(page_num)
+        if request is None or request[1] != dpi:
+            return
+        del self.requested[page_num]
+        pixmap = QPixmap.fromImage(image)
+        self.page_cache.put("thumbnails", thumbnail_key(self.document.doc_hash, page_num), pixmap)
+        self.show_thumbnail(page_num, pixmap)
+
+    def show_thumbnail(self, page_num, pixmap):
+        self.item(page_num).setIcon(QIcon(pixmap))
+        self.loaded.add(page_num)
+
+    def on_current_row_changed(self, row):
+        if row >= 0:
+            self.pageSelected.emit(row)
+
+    def mousePressEvent(self, event):
+        self.row_at_press = self.currentRow()
+        super().mousePressEvent(event)
+
+    def on_item_clicked(self, item):
+        # A click on another row was already reported by currentRowChanged, only clicks on the current page go back to it
+        row = self.row(item)
+        if row == self.row_at_press:
+            self.pageSelected.emit(row)
+
+    def set_current_page(self, page_num):
+        """Follow the page shown in the view, without jumping back to it."""
+        if page_num == self.currentRow():
+            return
+        self.blockSignals(True)
+        self.setCurrentRow(page_num)
+        self.blockSignals(False)
+        self.scrollToItem(self.item(page_num))
+
+    def release(self):
+        """Stop loading thumbnails, called when the tab of the document is closed."""
+        self.update_timer.stop()
+        self.render_service.pageRendered.disconnect(self.on_page_rendered)
+        for job_id, dpi in self.requested.values():
+            self.render_service.cancel(job_id)
+        self.requested.clear()
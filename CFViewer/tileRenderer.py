@@ -0,0 +1,60 @@
+"""
+Tile geometry for pages too large to rasterize in one piece.
+
+A page at a given DPI is split into a grid of square tiles. Every tile is
+rendered on its own through a clip rectangle, so the memory needed follows
+the tile size instead of the page size. The viewer uses TILE_SIZE tiles and
+only requests the ones in view, printing uses the largest tiles that fit in
+its memory budget and streams them one after another.
+"""
+import math
+
+
+TILE_SIZE = 512  # Tile edge in pixels in the viewer
+TILE_THRESHOLD_PIXELS = 4096 * 4096  # Pages with more pixels than this at their display DPI are tiled
+
+
+def page_pixels(page_size, dpi):
+    """Size in pixels of a page of `page_size` points rendered at `dpi`."""
+    return math.ceil(page_size[0] * dpi / 72), math.ceil(page_size[1] * dpi / 72)
+
+
+def needs_tiling(page_size, dpi, threshold=TILE_THRESHOLD_PIXELS):
+    width, height = page_pixels(page_size, dpi)
+    return width * height > threshold
+
+
+def tile_grid(page_size, dpi, tile_size=TILE_SIZE):
+    """Number of (columns, rows) of tiles covering the page."""
+    width, height = page_pixels(page_size, dpi)
+    return math.ceil(width / tile_size), math.ceil(height / tile_size)
+
+
+def tile_clip(page_size, dpi, column, row, tile_size=TILE_SIZE):
+    """Clip rectangle (x0, y0, x1, y1) in points of a tile, tiles on the right and bottom edge are cut to the page."""
+    step = tile_size * 72 / dpi
+    x0 = column * step
+    y0 = row * step
+    return (x0, y0, min(x0 + step, page_size[0]), min(y0 + step, page_size[1]))
+
+
+def tiles_in_rect(page_size, dpi, rect, tile_size=TILE_SIZE):
+    """(column, row) of the tiles intersecting `rect` (x0, y0, x1, y1), given in pixels of the page at `dpi`."""
+    columns, rows = tile_grid(page_size, dpi, tile_size)
+    x0, y0, x1, y1 = rect
+    first_column = max(0, int(x0 // tile_size))
+    last_column = min(columns - 1, int(math.ceil(x1 / tile_size)) - 1)
+    first_row = max(0, int(y0 // tile_size))
+    last_row = min(rows - 1, int(math.ceil(y1 / tile_size)) - 1)
+    return [(column, row) for row in range(first_row, last_row + 1) for column in range(first_column, last_column + 1)]
+
+
+def all_tiles(page_size, dpi, tile_size=TILE_SIZE):
+    columns, rows = tile_grid(page_size, dpi, tile_size)
+    return [(column, row) for row in range(rows) for column in range(columns)]
+
+
+def tile_size_for_budget(budget_bytes, bytes_per_pixel=3, multiple=TILE_SIZE):
+    """Largest square tile, a multiple of `multiple` pixels, whose raster fits in `budget_bytes`."""
+    edge = int(math.sqrt(budget_bytes / bytes_per_pixel))
+    return max(multiple, edge // multiple * multiple)
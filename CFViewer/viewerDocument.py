@@ -0,0 +1,90 @@
+import hashlib
+
+import instrumentation
+
+
+class ViewerDocument:
+    """
+    One QFS file opened in a viewer tab.
+
+    Owns the in-memory fitz.Document, the page metadata, the document handle
+    registered with the render service and the page loader and thumbnail
+    sidebar of the tab. close()
+    releases all of them when the tab is closed.
+
+    Page sizes come from the page index stored by the converter when the file
+    has one (see qfsFormat PIDX), so the pages can be laid out without
+    loading them from the PDF. The encoded thumbnails stored alongside
+    (THMB) are kept in `thumbnails`.
+
+    `doc_hash`, the SHA-256 of the payload, keys everything rendered from
+    the document. Files in chunk store mode give the hash verified while the
+    payload was read, so it is not computed a second time.
+    """
+
+    def __init__(self, qfs_path, metadata, payload, render_service, page_cache, page_index=None, thumbnails=None,
+                 payload_sha256=None):
+        # Imported on first use, it is not needed to show the window
+        import fitz  # PyMuPDF for PDFs
+
+        self.qfs_path = qfs_path
+        self.metadata = metadata
+        self.render_service = render_service
+        self.page_cache = page_cache
+        self.loader = None
+        self.sidebar = None
+        self.thumbnails = thumbnails or []  # Encoded images, one per page, empty if the file has none
+
+        # Content hash of the payload, used as the page cache key
+        self.doc_hash = payload_sha256 or hashlib.sha256(payload).hexdigest()
+        with instrumentation.span("fitz open"):
+            self.pdf_document = fitz.open(stream=payload, filetype="pdf")
+        # The render workers get the decoded payload through shared memory, they do not read the file again
+        self.doc_key = render_service.open_document(payload, self.doc_hash)
+
+        self.page_sizes = []  # Displayed page sizes in points
+        self.page_dimensions = []  # Original page sizes in centimeters
+        if page_index is not None and page_index.get("page_count") == len(self.pdf_document):
+            self.load_page_index(page_index)
+        else:
+            self.load_page_metadata()
+
+    @property
+    def file_name(self):
+        return self.metadata["file_name"]
+
+    @property
+    def page_count(self):
+        return len(self.pdf_document)
+
+    def add_page_size(self, width_points, height_points, rotation):
+        # Rotated pages are displayed with their sides swapped
+        if rotation in (90, 270):
+            self.page_sizes.append((height_points, width_points))
+        else:
+            self.page_sizes.append((width_points, height_points))
+
+        # Convert points to centimeters (1 point = 0.0352778 cm)
+        self.page_dimensions.append((width_points * 0.0352778, height_points * 0.0352778))
+
+    def load_page_index(self, page_index):
+        for width_points, height_points, rotation in page_index["pages"]:
+            self.add_page_size(width_points, height_points, rotation)
+
+    def load_page_metadata(self):
+        for page in self.pdf_document:
+            # Get original dimensions in points (1 point = 1/72 inch)
+            self.add_page_size(page.mediabox.width, page.mediabox.height, page.rotation)
+
+    def close(self, release_cache=True):
+        """Release the fitz handle, the render workers' handles and, optionally, the cached pages."""
+        if self.loader is not None:
+            self.loader.close()
+            self.loader = None
+        if self.sidebar is not None:
+            self.sidebar.release()
+            self.sidebar = None
+        self.render_service.close_document(self.doc_key)
+        self.pdf_document.close()
+        if release_cache:
+            self.page_cache.discard_document(self.doc_hash)
@@ -0,0 +1,81 @@
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QPixmap, QPainter, QColor, QFont, QBrush
+from PyQt5.QtCore import Qt
+
+
+TILE_SIZE = 200  # Watermark tile size in device independent pixels
+
+# (text, device pixel ratio) -> QBrush of the watermark tile
+_tile_brushes = {}
+
+
+def generate_watermark_pixmap(text, device_pixel_ratio=1.0, width=TILE_SIZE, height=TILE_SIZE):
+    """Draw one watermark tile, rendered at the device pixel ratio of the screen."""
+    pixmap = QPixmap(round(width * device_pixel_ratio), round(height * device_pixel_ratio))
+    pixmap.setDevicePixelRatio(device_pixel_ratio)
+    pixmap.fill(Qt.transparent)
+
+    painter = QPainter(pixmap)
+    painter.setRenderHint(QPainter.TextAntialiasing)
+    painter.setPen(QColor(200, 200, 200, 90))  # Semi-transparent gray
+    font = QFont("Arial", 30)
+    painter.setFont(font)
+
+    center_x = int(width / 2)
+    center_y = int(height / 2)
+
+    painter.translate(center_x, center_y)
+    painter.rotate(-45)
+    painter.drawText(-center_x, 0, text)
+    painter.end()
+    return pixmap
+
+
+def watermark_brush(text, device_pixel_ratio=1.0):
+    """Return the cached tile brush for `text`, drawing the tile on first use."""
+    key = (text, float(device_pixel_ratio))
+    brush = _tile_brushes.get(key)
+    if brush is None:
+        brush = QBrush(generate_watermark_pixmap(text, device_pixel_ratio))
+        _tile_brushes[key] = brush
+    return brush
+
+
+def clear_watermark_cache():
+    _tile_brushes.clear()
+
+
+class WatermarkedWidget(QWidget):
+    """
+    Container that paints a tiled watermark behind its children.
+
+    The tile is drawn once per text and screen scale and shared by
+    every widget, and only the exposed part of the widget is filled, so
+    scrolling through a tall document only repaints the strip that scrolled in.
+    """
+
+    def __init__(self, parent=None, watermark_text="QFS COPY"):
+        super().__init__(parent)
+        self.watermark_text = watermark_text
+        self._brush = None
+        self._brush_key = None
+
+    def set_watermark_text(self, text):
+        self.watermark_text = text
+        self.update()
+
+    def watermark_brush(self):
+        # The same semi-transparent gray is used in both themes, only the scale of the screen the window is on matters
+        key = (self.watermark_text, self.devicePixelRatioF())
+        if key != self._brush_key:
+            self._brush = watermark_brush(*key)
+            self._brush_key = key
+        return self._brush
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        # The brush is anchored at the widget origin, so the tiles line up across partial repaints
+        painter.fillRect(event.rect(), self.watermark_brush())
+        painter.end()
+
+        super().paintEvent(event)